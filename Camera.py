@@ -0,0 +1,111 @@
+# SOFT CAMERA CLASS
+#
+# Describes the detector (camera) of a SOFT image, and
+# projects points in the tokamak coordinate system onto
+# the camera plane. All matrices are computed once, when
+# the camera is created.
+#
+
+import numpy as np
+
+class Camera:
+
+    def __init__(self, position, direction, roll=0, visang=None):
+        """
+        Create a new camera.
+
+        position:  Position of the camera (3-vector).
+        direction: Viewing direction of the camera (unit 3-vector).
+        roll:      Camera roll angle (radians).
+        visang:    Vision angle of the camera (radians).
+        """
+        self.position = np.asarray(position, dtype=float)
+        self.direction = np.asarray(direction, dtype=float)
+        self.roll = roll
+        self.visang = visang
+
+        # Matrix rotating the viewing direction onto the y axis
+        y = [0,1,0]
+        v = np.cross(self.direction, y)
+        c = np.dot(self.direction, y)
+
+        vmat = np.array([[0,-v[2],v[1]], [v[2],0,-v[0]], [-v[1],v[0],0]])
+        self.rotation = np.identity(3) + vmat + np.dot(vmat, vmat) / (1+c)
+
+        # Matrix rotating the camera about its viewing direction
+        self.rollRotation = Camera.rotationMatrix(self.direction, roll)
+
+        # Rotation matrix including roll
+        self.rotationWithRoll = np.matmul(self.rotation, self.rollRotation)
+
+        # Camera position in the rotated frame
+        self.translation = np.matmul(self.rotation, self.position)
+
+        # Cosine and sine of the toroidal angle at which
+        # poloidal cross sections are orthogonal to the
+        # viewing direction
+        cossin = np.array([self.direction[1], self.direction[0]])
+        self.cossin = cossin / np.sqrt(cossin[0]**2 + cossin[1]**2)
+
+    def matches(self, position, direction, roll=0, visang=None):
+        """
+        Checks whether this camera has the given setup.
+        """
+        return (np.array_equal(self.position, position) and
+                np.array_equal(self.direction, direction) and
+                self.roll == roll and self.visang == visang)
+
+    def orthogonalCrossSection(self, rc, zc):
+        """
+        Rotate the poloidal cross section (rc, zc) to the toroidal
+        angle at which it is orthogonal to the viewing direction.
+        Returns an Nx3 array of points.
+        """
+        rc = np.asarray(rc, dtype=float)
+        return np.column_stack((rc*self.cossin[0], -rc*self.cossin[1], zc))
+
+    def transform(self, points, roll=False):
+        """
+        Rotate and translate the given points (an array with
+        shape (..., 3)) into the frame of the camera, in which
+        the camera is at origo and looks along the y axis.
+
+        roll: If True, the camera roll is also applied.
+        """
+        if roll:
+            R = self.rotationWithRoll
+        else:
+            R = self.rotation
+
+        return np.matmul(points, R.T) - self.translation
+
+    def project(self, points, roll=False):
+        """
+        Project the given points (an array with shape (..., 3))
+        onto the camera plane (at unit distance from the camera).
+        Returns an array of shape (..., 2) with the coordinates of
+        the points in the image.
+
+        roll: If True, the camera roll is also applied.
+        """
+        p = self.transform(points, roll=roll)
+        return np.stack((p[...,0] / p[...,1], p[...,2] / p[...,1]), axis=-1)
+
+    @staticmethod
+    def rotationMatrix(axis, angle=0):
+        """
+        Matrix for rotating by -'angle' about the unit vector 'axis'.
+        """
+        dx = axis[0]
+        dy = axis[1]
+        dz = axis[2]
+
+        cs = np.cos(-angle)
+        sn = np.sin(-angle)
+
+        return np.array([
+            [cs+dx**2*(1-cs),    dx*dy*(1-cs)-dz*sn, dx*dz*(1-cs)+dy*sn],
+            [dy*dx*(1-cs)+dz*sn, cs+dy**2*(1-cs),    dy*dz*(1-cs)-dx*sn],
+            [dz*dx*(1-cs)-dy*sn, dz*dy*(1-cs)+dx*sn, cs+dz**2*(1-cs)]
+        ])
+
@@ -0,0 +1,245 @@
+# SOFT DATASET CACHE
+#
+# Keeps the data of recently loaded SOFT outputs in memory, so
+# that files which are revisited (e.g. when flipping between
+# the outputs of one scan) are shown without reading them again.
+# The least recently used data is evicted when the total size of
+# the cached arrays exceeds a given memory budget, or when the
+# number of entries exceeds a given maximum. The latter limits
+# the number of memory-mapped files kept open, which are not
+# counted against the budget.
+#
+
+import collections
+import numpy as np
+import os
+import threading
+
+from softio import fileSignature
+from Stokes import Stokes
+
+
+class DatasetCache:
+
+    # Default memory budget (bytes)
+    BUDGET = int(os.environ.get('SOFTVIZ_CACHE_BUDGET', 1024**3))
+    # Default maximum number of entries
+    MAX_ENTRIES = int(os.environ.get('SOFTVIZ_CACHE_ENTRIES', 32))
+
+    def __init__(self, budget=BUDGET, maxEntries=MAX_ENTRIES):
+        """
+        Create a new cache.
+
+        budget:     Maximum number of bytes of (in-memory) arrays to
+                    keep in the cache. Memory-mapped arrays are not
+                    counted, since their memory is managed by the OS.
+        maxEntries: Maximum number of entries to keep in the cache,
+                    so that entries of only memory-mapped arrays are
+                    evicted as well.
+        """
+        self.budget = budget
+        self.maxEntries = maxEntries
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = collections.OrderedDict()   # key -> (value, ids of arrays), least recently used first
+        self._arrays = {}   # id -> [array, nbytes, number of entries using it]
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """
+        Remove all entries (the statistics are kept).
+        """
+        with self._lock:
+            for key in list(self._entries.keys()):
+                self._remove(key)
+
+    def get(self, key):
+        """
+        Returns the value stored with the given key, or None if
+        the key is not in the cache.
+        """
+        with self._lock:
+            if key is None or key not in self._entries:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def getBudget(self): return self.budget
+    def getMaxEntries(self): return self.maxEntries
+    def getSize(self): return self.size
+
+    def getStatistics(self):
+        """
+        Returns a dict with the number of hits, misses and
+        evictions, the number of entries and the maximum number of
+        entries, and the size and budget (in bytes) of the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'maxEntries': self.maxEntries,
+            'size': self.size,
+            'budget': self.budget
+        }
+
+    def put(self, key, value):
+        """
+        Store a value (a dict of arrays, such as returned by
+        'SyntheticImage.readImageFile') in the cache, evicting
+        the least recently used entries if needed. Arrays shared
+        by several entries are only counted once. Values which
+        do not fit in the budget on their own are not stored.
+        """
+        with self._lock:
+            if key is None:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+
+            arrays = {}
+            for arr in DatasetCache._getArrays(value):
+                root = DatasetCache._getRoot(arr)
+                if isinstance(root, np.ndarray):
+                    arrays[id(root)] = root
+
+            # Size of the arrays not already in the cache
+            nbytes = sum(arr.nbytes for i, arr in arrays.items() if i not in self._arrays)
+            if nbytes > self.budget:
+                return
+
+            for i, arr in arrays.items():
+                if i in self._arrays:
+                    self._arrays[i][2] += 1
+                else:
+                    self._arrays[i] = [arr, arr.nbytes, 1]
+
+            self.size += nbytes
+            self._entries[key] = (value, list(arrays.keys()))
+            self._evict()
+
+    def remove(self, key):
+        """
+        Remove the entry with the given key (if any).
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def removeOutdated(self, filename, signature):
+        """
+        Remove all entries of the named file which were read
+        from a different version of the file than the one with
+        the given signature (see 'softio.fileSignature').
+        """
+        path, signature = os.path.abspath(filename), tuple(signature or ())
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if key[0] == path and key[1:-1] != signature:
+                    self._remove(key)
+
+    def setBudget(self, budget):
+        """
+        Set the memory budget (bytes), evicting entries if the
+        cache no longer fits.
+        """
+        with self._lock:
+            self.budget = budget
+            self._evict()
+
+    def setMaxEntries(self, maxEntries):
+        """
+        Set the maximum number of entries, evicting entries if
+        there are more.
+        """
+        with self._lock:
+            self.maxEntries = maxEntries
+            self._evict()
+
+    def _evict(self):
+        while (self.size > self.budget or len(self._entries) > self.maxEntries) and len(self._entries) > 0:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, ids = self._entries.pop(key)
+        for i in ids:
+            a = self._arrays[i]
+            a[2] -= 1
+            if a[2] == 0:
+                self.size -= a[1]
+                del self._arrays[i]
+
+    @staticmethod
+    def fileKey(filename, imgtype, signature=None):
+        """
+        Returns the cache key of the data of the named file, shown
+        as the given image type. The key includes the size and
+        modification time of the file, so that data of files which
+        have changed is never used. Returns None if the file does
+        not exist.
+
+        signature: Signature of the file (see 'softio.fileSignature').
+                   Taken from the file if not given.
+        """
+        if signature is None:
+            signature = fileSignature(filename)
+            if signature is None:
+                return None
+
+        return (os.path.abspath(filename),) + tuple(signature) + (imgtype,)
+
+    @staticmethod
+    def _getArrays(value):
+        """
+        Yields all arrays contained in the given value.
+        """
+        if isinstance(value, np.ndarray):
+            yield value
+        elif isinstance(value, Stokes):
+            yield from DatasetCache._getArrays(value.data)
+        elif isinstance(value, dict):
+            for v in value.values():
+                yield from DatasetCache._getArrays(v)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                yield from DatasetCache._getArrays(v)
+
+    @staticmethod
+    def _getRoot(arr):
+        """
+        Returns the object owning the memory of the given array.
+        This is an array for data in memory, and e.g. an 'mmap'
+        object for memory-mapped files.
+        """
+        while getattr(arr, 'base', None) is not None:
+            arr = arr.base
+
+        return arr
+
+
+# Cache used by all images of this process
+_datasetCache = DatasetCache()
+
+
+def getDatasetCache():
+    """
+    Returns the dataset cache of this session (process).
+    """
+    return _datasetCache
+
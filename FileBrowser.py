@@ -0,0 +1,250 @@
+# SOFT FILE BROWSER
+#
+# Window listing all SOFT outputs in a directory, with thumbnails
+# of the images. Thumbnails are rendered by a pool of worker
+# processes (see 'thumbnails.py') and shown as they become ready.
+#
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QSize, Qt, pyqtSignal
+from PyQt5.QtGui import QIcon, QPixmap
+from PyQt5.QtWidgets import QFileDialog
+
+import thumbnails
+from PolarizedImage import ImageType
+
+
+class FileBrowser(QtWidgets.QWidget):
+    fileSelected = pyqtSignal(str)
+    # Emitted (from a worker thread) when a thumbnail has been
+    # rendered: generation, SOFT output, thumbnail file ('' on failure)
+    thumbnailReady = pyqtSignal(int, str, str)
+
+    def __init__(self, parent=None, jobs=None):
+        """
+        Create a new file browser.
+
+        jobs: Number of processes to render thumbnails with
+              (default: number of CPUs).
+        """
+        QtWidgets.QWidget.__init__(self, parent)
+        self.setWindowTitle('SOFT outputs')
+        self.resize(480, 600)
+
+        self.directory = None
+        self.files = []
+        self.jobs = jobs
+
+        # Thumbnail settings
+        self.thumbnailSize = thumbnails.THUMBNAIL_SIZE
+        self.colormapName = 'GeriMap'
+        self.logarithmic = False
+        self.imageType = ImageType.I
+
+        self._executor = None       # Created when the first thumbnail is rendered
+        self._futures = []          # Thumbnails being rendered
+        self._generation = 0        # Incremented whenever all thumbnails are re-rendered
+        self._items = {}            # SOFT output -> list item
+
+        self.lblDirectory = QtWidgets.QLabel()
+        self.btnDirectory = QtWidgets.QPushButton('Open directory...')
+
+        self.list = QtWidgets.QListWidget()
+        self.list.setViewMode(QtWidgets.QListView.IconMode)
+        self.list.setIconSize(QSize(self.thumbnailSize, self.thumbnailSize))
+        self.list.setResizeMode(QtWidgets.QListView.Adjust)
+        self.list.setMovement(QtWidgets.QListView.Static)
+        self.list.setUniformItemSizes(True)
+        self.list.setWordWrap(True)
+
+        top = QtWidgets.QHBoxLayout()
+        top.addWidget(self.lblDirectory, 1)
+        top.addWidget(self.btnDirectory)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(top)
+        layout.addWidget(self.list)
+        self.setLayout(layout)
+
+        self.btnDirectory.clicked.connect(self.chooseDirectory)
+        self.list.currentItemChanged.connect(self._currentItemChanged)
+        self.thumbnailReady.connect(self._setThumbnail)
+
+    def chooseDirectory(self):
+        directory = QFileDialog.getExistingDirectory(self, 'Open directory with SOFT outputs', self.directory or '')
+        if directory:
+            self.setDirectory(directory)
+
+    def closeEvent(self, event):
+        self.cancelThumbnails()
+        event.accept()
+
+    def cancelThumbnails(self):
+        """
+        Cancel all thumbnails not yet being rendered.
+        """
+        for future in self._futures:
+            future.cancel()
+
+        self._futures = []
+
+    def getNeighbours(self, filename, n=1):
+        """
+        Returns the 'n' files following and preceding the given
+        file in the browser (nearest first).
+        """
+        try:
+            i = self.files.index(os.path.abspath(filename))
+        except ValueError:
+            return []
+
+        neighbours = []
+        for j in range(1, n+1):
+            for k in [i+j, i-j]:
+                if 0 <= k < len(self.files):
+                    neighbours.append(self.files[k])
+
+        return neighbours
+
+    def setCurrentFile(self, filename):
+        """
+        Show the directory of the given file, with the file selected.
+        """
+        filename = os.path.abspath(filename)
+        self.setDirectory(os.path.dirname(filename))
+
+        item = self._items.get(filename)
+        if item is not None:
+            # The file is already shown, so don't select it again
+            self.list.blockSignals(True)
+            self.list.setCurrentItem(item)
+            self.list.blockSignals(False)
+            self.list.scrollToItem(item)
+
+    def setDirectory(self, directory, force=False):
+        """
+        List the SOFT outputs in the given directory.
+
+        force: If True, the directory is listed again even if
+               it is already shown.
+        """
+        directory = os.path.abspath(directory)
+        if directory == self.directory and not force:
+            return
+
+        self.directory = directory
+        self.lblDirectory.setText(directory)
+        self.lblDirectory.setToolTip(directory)
+
+        try:
+            self.files = thumbnails.listOutputs(directory)
+        except OSError:
+            self.files = []
+
+        self.list.blockSignals(True)
+        self.list.clear()
+        self._items = {}
+        for f in self.files:
+            item = QtWidgets.QListWidgetItem(os.path.basename(f))
+            item.setData(Qt.UserRole, f)
+            item.setToolTip(f)
+            item.setSizeHint(QSize(self.thumbnailSize+16, self.thumbnailSize+40))
+            self.list.addItem(item)
+            self._items[f] = item
+        self.list.blockSignals(False)
+
+        self.updateThumbnails()
+
+    def setThumbnailSettings(self, colormapName, logarithmic, imgtype):
+        """
+        Render thumbnails using the given colormap, intensity
+        scale and polarization quantity.
+        """
+        settings = (colormapName, logarithmic, imgtype)
+        if settings == (self.colormapName, self.logarithmic, self.imageType):
+            return
+
+        self.colormapName, self.logarithmic, self.imageType = settings
+        self.updateThumbnails()
+
+    def shutdown(self):
+        """
+        Stop rendering thumbnails and shut down the worker processes.
+        """
+        self.cancelThumbnails()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def updateThumbnails(self):
+        """
+        (Re-)render the thumbnails of all files in the browser.
+        Thumbnails already in the on-disk cache are only loaded.
+        """
+        self.cancelThumbnails()
+        self._generation += 1
+
+        generation = self._generation
+        for f in self.files:
+            # Thumbnails in the cache are shown right away
+            try:
+                thumbfile = thumbnails.thumbnailName(f, self.thumbnailSize, self.colormapName, self.logarithmic, self.imageType)
+            except OSError:
+                continue
+
+            if os.path.isfile(thumbfile):
+                self._setThumbnail(generation, f, thumbfile)
+                continue
+
+            if self._executor is None:
+                # Worker processes are started rather than forked, since
+                # forking a process running Qt threads is not safe
+                self._executor = ProcessPoolExecutor(max_workers=self.jobs, mp_context=multiprocessing.get_context('spawn'))
+
+            future = self._executor.submit(thumbnails.getThumbnail, f, self.thumbnailSize,
+                                           self.colormapName, self.logarithmic, self.imageType)
+            future.add_done_callback(lambda future, f=f : self._thumbnailDone(generation, f, future))
+            self._futures.append(future)
+
+    def _currentItemChanged(self, current, previous):
+        if current is not None:
+            self.fileSelected.emit(current.data(Qt.UserRole))
+
+    def _thumbnailDone(self, generation, filename, future):
+        """
+        Called (in a thread of the worker pool) when a thumbnail
+        has been rendered. The thumbnail is passed on to the GUI
+        thread with a signal.
+        """
+        if future.cancelled():
+            return
+
+        try:
+            thumbfile = future.result()
+        except Exception:
+            thumbfile = ''
+
+        try:
+            self.thumbnailReady.emit(generation, filename, thumbfile)
+        except RuntimeError:
+            # The browser has been deleted
+            pass
+
+    def _setThumbnail(self, generation, filename, thumbfile):
+        # Discard thumbnails of earlier settings or directories
+        if generation != self._generation:
+            return
+
+        item = self._items.get(filename)
+        if item is None:
+            return
+
+        if thumbfile:
+            item.setIcon(QIcon(QPixmap(thumbfile)))
+        else:
+            item.setToolTip(filename+'\n(Unable to render thumbnail)')
+
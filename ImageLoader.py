@@ -0,0 +1,68 @@
+# SOFT IMAGE LOADER
+#
+# Runs (slow) loading and preprocessing of images in a
+# background thread, so that the GUI remains responsive
+# while files are being read.
+#
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class LoadCancelled(Exception):
+    """
+    Raised in the loader thread to abort a cancelled task.
+    """
+    pass
+
+
+class ImageLoader(QThread):
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(int, str)
+
+    def __init__(self, task, parent=None):
+        """
+        Create a new loader.
+
+        task: Function 'task(progress)' to run in the background.
+              The task should call 'progress(fraction, text)' now and
+              then to report its progress, which also gives the loader
+              a chance to abort the task if it has been cancelled.
+              The return value of the task is emitted with 'loaded'.
+        """
+        QThread.__init__(self, parent)
+        self.task = task
+        self._cancelled = False
+
+    def cancel(self):
+        """
+        Cancel the task. The task is aborted the next time it
+        reports its progress, and nothing more is emitted.
+        """
+        self._cancelled = True
+
+    def isCancelled(self): return self._cancelled
+
+    def run(self):
+        try:
+            data = self.task(self._reportProgress)
+        except LoadCancelled:
+            return
+        except Exception as e:
+            if not self._cancelled:
+                self.failed.emit(str(e))
+            return
+
+        # The task may have finished without reporting its progress
+        # after being cancelled
+        if self._cancelled:
+            return
+
+        self.loaded.emit(data)
+
+    def _reportProgress(self, fraction, text):
+        if self._cancelled:
+            raise LoadCancelled()
+
+        self.progress.emit(int(round(100*fraction)), text)
+
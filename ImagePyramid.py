@@ -0,0 +1,95 @@
+# SOFT IMAGE PYRAMID CLASS
+#
+# Multi-resolution representation of a (large) image, in
+# which each level is downsampled by a factor of two from
+# the previous level. Used for displaying very large images
+# quickly, by only showing as many pixels as can actually
+# be seen on the screen.
+#
+
+import numpy as np
+
+class ImagePyramid:
+
+    # Available methods for combining 2x2 pixels into one
+    REDUCTIONS = ['mean', 'max', 'sum']
+
+    def __init__(self, image, reduction='mean', minSize=256):
+        """
+        Build an image pyramid.
+
+        image:     Full resolution image (level 0).
+        reduction: How to combine pixels when downsampling.
+                   'mean' preserves the intensity scale, 'max'
+                   preserves narrow bright features and 'sum'
+                   preserves the total flux of the image.
+        minSize:   Levels are added until the smallest side
+                   of the image is below this size.
+        """
+        if reduction not in ImagePyramid.REDUCTIONS:
+            raise ValueError("Unrecognized reduction '{0}'. Must be one of {1}.".format(reduction, ImagePyramid.REDUCTIONS))
+
+        self.reduction = reduction
+        self.levels = [image]
+
+        while min(self.levels[-1].shape) >= 2*minSize:
+            self.levels.append(ImagePyramid.downsample(self.levels[-1], reduction))
+
+    def __len__(self):
+        return len(self.levels)
+
+    def getLevel(self, level):
+        """
+        Returns the image at the given level (0 = full resolution).
+        """
+        return self.levels[min(max(level, 0), len(self.levels)-1)]
+
+    def selectLevel(self, visibleFraction, screenSize):
+        """
+        Select the coarsest level which still has at least one
+        image pixel per screen pixel.
+
+        visibleFraction: Tuple (fy, fx) with the fraction of the
+                         image height and width which is visible.
+        screenSize:      Tuple (height, width) of the area in which
+                         the image is shown, in screen pixels.
+        """
+        ny, nx = self.levels[0].shape
+        level = len(self.levels)-1
+        for n, f, s in zip((ny, nx), visibleFraction, screenSize):
+            if s <= 0 or f <= 0:
+                continue
+
+            ratio = n * f / s
+            if ratio < 2:
+                return 0
+            else:
+                level = min(level, int(np.floor(np.log2(ratio))))
+
+        return level
+
+    @staticmethod
+    def downsample(image, reduction='mean'):
+        """
+        Downsample the given image by a factor of two along both
+        axes. Images with an odd number of rows or columns are padded
+        (with zeros when summing, so that the flux is preserved, and
+        by repeating the last row/column otherwise).
+        """
+        ny, nx = image.shape
+        pad = ((0, ny % 2), (0, nx % 2))
+        if ny % 2 or nx % 2:
+            if reduction == 'sum':
+                image = np.pad(image, pad, mode='constant')
+            else:
+                image = np.pad(image, pad, mode='edge')
+
+        blocks = image.reshape((image.shape[0]//2, 2, image.shape[1]//2, 2))
+
+        if reduction == 'mean':
+            return blocks.mean(axis=(1,3))
+        elif reduction == 'max':
+            return blocks.max(axis=(1,3))
+        else:
+            return blocks.sum(axis=(1,3))
+
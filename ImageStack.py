@@ -0,0 +1,214 @@
+# SOFT IMAGE STACK
+#
+# The images of a parameter scan (e.g. over pitch angle, energy
+# or time) consolidated into one memory-mapped (N, ny, nx) array,
+# so that the frames can be scrubbed through without reopening
+# the SOFT outputs. The stack is built on first use and stored in
+# an on-disk cache, together with the maximum and minimum of each
+# frame and the geometry and overlays shared by all frames. The
+# cache is keyed on the paths, sizes and modification times of
+# all outputs, so stale stacks are never used.
+#
+# Building and reading stacks does not require Qt.
+#
+
+import glob
+import hashlib
+import numpy as np
+import os
+
+from PolarizedImage import ImageType
+from Profiler import profiled
+from softio import CACHE_DIRECTORY, GEOMETRY
+
+
+# Directory in which stacks are cached
+STACK_DIRECTORY = os.path.join(CACHE_DIRECTORY, 'stacks')
+
+
+class ImageStack:
+
+    # Variables taken from the first output and shared by all frames
+    SHARED = GEOMETRY + ['wall', 'wall_rmax', 'wall_rmin', 'separatrix']
+
+    def __init__(self, filenames, imgtype=ImageType.I, dtype=None):
+        """
+        Create a new stack of the images in the named SOFT outputs,
+        which must all have the same image size and detector geometry.
+        Nothing is read until 'load' is called.
+
+        filenames: Names of SOFT outputs, in the order of the frames.
+        imgtype:   Polarization quantity to show (polarized images only).
+        dtype:     Data type of the stack (default: that of the first image).
+        """
+        if len(filenames) == 0:
+            raise ValueError("No SOFT outputs given for the image stack.")
+
+        self.filenames = [os.path.abspath(f) for f in filenames]
+        self.imageType = imgtype
+        self.dtype = dtype
+
+        self.frames = None      # Memory-mapped (N, ny, nx) array
+        self.maxima = None      # Maximum of each frame
+        self.minima = None      # Minimum of each frame
+        self.shared = None      # Variables shared by all frames (see 'SHARED')
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def getBaseData(self):
+        """
+        Returns a dict with the first frame and the geometry and
+        overlays of the stack, which can be passed on to
+        'SyntheticImage.setImageFileData'.
+        """
+        data = dict(self.shared)
+        data['imageType'] = self.imageType
+        data['imageData'] = self.getFrame(0)
+        data['_imageMax'] = self.getMax(0)
+
+        return data
+
+    def getCacheNames(self):
+        """
+        Returns the names of the cache files of the stack (the
+        frames, and the maxima, minima and shared variables).
+        """
+        settings = '|'.join(self.filenames + [self.imageType.value, str(self.dtype and np.dtype(self.dtype))])
+        key = hashlib.sha1(settings.encode('utf-8')).hexdigest()
+
+        signatures = []
+        for f in self.filenames:
+            st = os.stat(f)
+            signatures.append('{0}-{1}'.format(st.st_size, st.st_mtime_ns))
+
+        version = hashlib.sha1('|'.join(signatures).encode('utf-8')).hexdigest()
+        name = os.path.join(STACK_DIRECTORY, '{0}-{1}'.format(key, version))
+
+        return name+'.npy', name+'.npz'
+
+    def getFilename(self, i): return self.filenames[i]
+    def getFilenames(self): return self.filenames
+    def getFrame(self, i): return self.frames[i]
+
+    def getMax(self, i=None):
+        """
+        Returns the maximum of frame 'i', or of all frames if
+        'i' is None.
+        """
+        if i is None:
+            return np.amax(self.maxima)
+        else:
+            return self.maxima[i]
+
+    def getMin(self, i=None):
+        """
+        Returns the minimum of frame 'i', or of all frames if
+        'i' is None.
+        """
+        if i is None:
+            return np.amin(self.minima)
+        else:
+            return self.minima[i]
+
+    def isLoaded(self): return self.frames is not None
+
+    @profiled('stack')
+    def load(self, progress=None):
+        """
+        Open the stack, consolidating the SOFT outputs into the
+        on-disk cache first if needed. Returns this stack.
+
+        progress: Optional function 'progress(fraction, text)' which
+                  is called as the outputs are read. It may raise an
+                  exception to abort reading.
+        """
+        if progress is None:
+            progress = lambda fraction, text : None
+
+        stackfile, statsfile = self.getCacheNames()
+        if not os.path.isfile(stackfile) or not os.path.isfile(statsfile):
+            self._consolidate(stackfile, statsfile, progress)
+
+        self.frames = np.load(stackfile, mmap_mode='r')
+        with np.load(statsfile) as stats:
+            self.maxima, self.minima = stats['maxima'], stats['minima']
+            self.shared = {k: stats[k][()] for k in stats.files if k in ImageStack.SHARED}
+
+        progress(1, 'Done')
+        return self
+
+    def _consolidate(self, stackfile, statsfile, progress):
+        """
+        Read all SOFT outputs and write their images to the
+        given cache files.
+        """
+        from SyntheticImage import SyntheticImage
+
+        n = len(self)
+        maxima, minima = np.zeros(n), np.zeros(n)
+        frames, shared = None, None
+
+        # Write to temporary files first, so that a stack is never
+        # used unless all its frames have been written
+        tmpstack, tmpstats = stackfile+'.tmp', statsfile+'.tmp'
+        os.makedirs(STACK_DIRECTORY, exist_ok=True)
+
+        try:
+            for i, f in enumerate(self.filenames):
+                fileProgress = lambda fraction, text, i=i : progress((i+fraction) / n, text)
+                data = SyntheticImage.readImageFile(f, self.imageType, lazy=True, cache=True, progress=fileProgress)
+
+                try:
+                    image = data['imageData']
+                    if frames is None:
+                        shared = {k: data[k] for k in ImageStack.SHARED if data.get(k) is not None}
+                        dtype = image.dtype if self.dtype is None else self.dtype
+                        frames = np.lib.format.open_memmap(tmpstack, mode='w+', dtype=dtype, shape=(n,)+image.shape)
+                    elif image.shape != frames.shape[1:]:
+                        raise ValueError("The image in '{0}' has size {1}, but the images of the stack have size {2}.".format(f, image.shape, frames.shape[1:]))
+                    elif not ImageStack._isSameGeometry(shared, data):
+                        raise ValueError("The detector geometry of '{0}' differs from that of '{1}'.".format(f, self.filenames[0]))
+
+                    frames[i] = image
+                    maxima[i] = np.amax(frames[i])
+                    minima[i] = np.amin(frames[i])
+                finally:
+                    if '_h5file' in data:
+                        data['_h5file'].close()
+
+            frames.flush()
+            del frames
+
+            # Remove stacks of earlier versions of the outputs
+            key = os.path.basename(stackfile).split('-')[0]
+            for old in glob.glob(os.path.join(STACK_DIRECTORY, key+'-*.np[yz]')):
+                os.remove(old)
+
+            with open(tmpstats, 'wb') as fh:
+                np.savez(fh, maxima=maxima, minima=minima, **shared)
+
+            os.replace(tmpstats, statsfile)
+            os.replace(tmpstack, stackfile)
+        except BaseException:
+            for tmp in [tmpstack, tmpstats]:
+                if os.path.isfile(tmp):
+                    os.remove(tmp)
+            raise
+
+    @staticmethod
+    def _isSameGeometry(shared, data):
+        """
+        Checks whether the detector geometry in 'data' is the
+        same as in 'shared'.
+        """
+        for name in GEOMETRY:
+            a, b = shared.get(name), data.get(name)
+            if (a is None) != (b is None):
+                return False
+            if a is not None and not np.array_equal(a, b):
+                return False
+
+        return True
+
+
@@ -1,22 +1,32 @@
 from PyQt5 import QtWidgets
 from ui import main_design
 from PlotWindow import PlotWindow
-from SetCaption import SetCaption
-from Vessel import Vessel
 import sys
 import os.path
-import numpy as np
-import scipy.io
-import h5py
-from matplotlib.colors import LinearSegmentedColormap
-import matplotlib.pyplot as plt
+from PyQt5.QtCore import QFileSystemWatcher, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QFileDialog
 from PyQt5.QtWidgets import QMessageBox
 
+from DatasetCache import DatasetCache, getDatasetCache
+from ImageLoader import ImageLoader
 from PolarizedImage import ImageType
+from Profiler import getSessionProfiler
+from SyntheticImage import SyntheticImage
+import softio
 
 
 class MainWindow(QtWidgets.QMainWindow):
+    imageShown = pyqtSignal()
+
+    # Stages whose latest times are shown in the status bar
+    TIMED_STAGES = ['load', 'derive', 'draw']
+    # Number of files on each side of the current file in the
+    # file browser which are loaded in advance
+    PREFETCH = 1
+
+    # Time (ms) a watched file must be left untouched before reloading
+    WATCH_INTERVAL = 500
+
     def __init__(self):
         QtWidgets.QMainWindow.__init__(self)
         self.ui = main_design.Ui_MainWindow()
@@ -33,12 +43,52 @@ class MainWindow(QtWidgets.QMainWindow):
         self.brightImageModifier = 1
         self.imageType = ImageType.I
 
+        self._loader = None         # Loader of the image currently being loaded
+        self._loaders = set()       # All loader threads still running
+        self._loadingFile = False   # Is '_loader' loading a file?
+        self._watchSignature = None # Size and mtime of the watched file at the previous check
+        self._fileData = None       # Data of the image shown (as stored in the dataset cache)
+        self._prefetchers = []      # Loaders of the files next to the current file
+        self.stack = None           # Image stack shown in the stack viewer (if a scan is open)
+
+        # Watch the open file for changes
+        self.watcher = QFileSystemWatcher()
+        self.watchTimer = QTimer()
+        self.watchTimer.setSingleShot(True)
+        self.watchTimer.setInterval(MainWindow.WATCH_INTERVAL)
+
         # Create plot window
         self.plotWindow = PlotWindow()
-        # Create caption dialog
-        self.captionDialog = SetCaption()
-        # Create vessel dialog
-        self.vesselDialog = Vessel()
+        # Caption and vessel dialogs are created when first shown
+        # (see 'getCaptionDialog()' and 'getVesselDialog()')
+        self.captionDialog = None
+        self.vesselDialog = None
+        # File browser is created when first shown (see 'getFileBrowser()')
+        self.fileBrowser = None
+        # Stack viewer is created when a scan is first opened (see 'getStackViewer()')
+        self.stackViewer = None
+
+        # Add menu
+        fileMenu = self.ui.menubar.addMenu('&File')
+        self.actionBrowse = fileMenu.addAction('&Browse directory...')
+        self.actionBrowse.setShortcut('Ctrl+B')
+        self.actionOpenScan = fileMenu.addAction('Open &scan...')
+        self.actionOpenScan.setShortcut('Ctrl+Shift+O')
+
+        # Add load progress indicator to status bar
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setMaximumWidth(150)
+        self.progressBar.setRange(0, 100)
+        self.btnCancelLoad = QtWidgets.QPushButton('Cancel')
+        # Time spent in the latest load and draw
+        self.lblTimings = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self.lblTimings)
+        # Memory used by the dataset cache
+        self.lblCache = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self.lblCache)
+        self.statusBar().addPermanentWidget(self.progressBar)
+        self.statusBar().addPermanentWidget(self.btnCancelLoad)
+        self.showLoadProgress(False)
 
         # Bind to events
         self.bindEvents()
@@ -84,6 +134,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def bindEvents(self):
         self.ui.sliderIntensity.valueChanged.connect(self.intensityChanged)
+        self.ui.sliderIntensity.sliderPressed.connect(lambda : self.plotWindow.setPreview(True))
+        self.ui.sliderIntensity.sliderReleased.connect(lambda : self.plotWindow.setPreview(False))
         self.ui.cbPlotType.currentIndexChanged.connect(self.toggleLogarithmic)
         self.ui.cbColormap.currentIndexChanged.connect(self.setColormap)
         self.ui.cbImageType.currentIndexChanged.connect(self.setImageType)
@@ -99,9 +151,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.btnSave.clicked.connect(self.saveFile)
         self.ui.btnSetCaption.clicked.connect(self.setCaption)
         self.ui.btnWall.clicked.connect(self.setWallOverlay)
-
-        self.captionDialog.captionsUpdated.connect(self.captionsUpdated)
-        self.vesselDialog.overlayChanged.connect(self.vesselUpdated)
+        self.btnCancelLoad.clicked.connect(self.cancelLoad)
+        self.ui.cbWatch.stateChanged.connect(self.toggleWatch)
+        self.watcher.fileChanged.connect(self.watchedFileChanged)
+        self.watcher.directoryChanged.connect(self.watchedFileChanged)
+        self.watchTimer.timeout.connect(self.checkWatchedFile)
+        self.actionBrowse.triggered.connect(self.showFileBrowser)
+        self.actionOpenScan.triggered.connect(self.openScan)
 
     def captionsUpdated(self, captions):
         self.plotWindow.image.setCaptions(captions)
@@ -111,11 +167,100 @@ class MainWindow(QtWidgets.QMainWindow):
         self.exit()
 
     def exit(self):
+        # Loader threads must finish before the window is destroyed
+        self.watchTimer.stop()
+        self.cancelLoad()
+        for loader in self._prefetchers:
+            loader.cancel()
+        for loader in list(self._loaders):
+            loader.wait()
+
         self.plotWindow.close()
-        self.captionDialog.close()
-        self.vesselDialog.close()
+        if self.captionDialog is not None:
+            self.captionDialog.close()
+        if self.vesselDialog is not None:
+            self.vesselDialog.close()
+        if self.fileBrowser is not None:
+            self.fileBrowser.shutdown()
+            self.fileBrowser.close()
+        if self.stackViewer is not None:
+            self.stackViewer.close()
         self.close()
 
+    def getFileBrowser(self):
+        """
+        Returns the file browser, creating it on first use.
+        """
+        if self.fileBrowser is None:
+            from FileBrowser import FileBrowser
+            self.fileBrowser = FileBrowser()
+            self.fileBrowser.setThumbnailSettings(*self.getThumbnailSettings())
+            self.fileBrowser.fileSelected.connect(self.loadFile)
+
+        return self.fileBrowser
+
+    def getThumbnailSettings(self):
+        """
+        Returns the colormap, intensity scale and image type
+        to render thumbnails with (the same as the plot).
+        """
+        image = self.plotWindow.image
+        return image.colormapName, image.logarithmic, self.imageType
+
+    def showFileBrowser(self):
+        browser = self.getFileBrowser()
+        if self.filename:
+            browser.setCurrentFile(self.filename)
+        elif browser.directory is None:
+            browser.chooseDirectory()
+
+        browser.show()
+        browser.raise_()
+
+    def updateFileBrowser(self):
+        """
+        Render thumbnails in the file browser (if open) with
+        the current plot settings.
+        """
+        if self.fileBrowser is not None:
+            self.fileBrowser.setThumbnailSettings(*self.getThumbnailSettings())
+
+    def getStackViewer(self):
+        """
+        Returns the stack viewer, creating it on first use.
+        """
+        if self.stackViewer is None:
+            from StackViewer import StackViewer
+            self.stackViewer = StackViewer()
+            self.stackViewer.frameChanged.connect(self.showFrame)
+            self.stackViewer.normalizationChanged.connect(lambda : self.showFrame(self.stackViewer.getFrame()))
+            self.stackViewer.slider.sliderPressed.connect(lambda : self.plotWindow.setPreview(True))
+            self.stackViewer.slider.sliderReleased.connect(lambda : self.plotWindow.setPreview(False))
+
+        return self.stackViewer
+
+    def getCaptionDialog(self):
+        """
+        Returns the caption dialog, creating it on first use.
+        """
+        if self.captionDialog is None:
+            from SetCaption import SetCaption
+            self.captionDialog = SetCaption()
+            self.captionDialog.captionsUpdated.connect(self.captionsUpdated)
+
+        return self.captionDialog
+
+    def getVesselDialog(self):
+        """
+        Returns the vessel dialog, creating it on first use.
+        """
+        if self.vesselDialog is None:
+            from Vessel import Vessel
+            self.vesselDialog = Vessel()
+            self.vesselDialog.overlayChanged.connect(self.vesselUpdated)
+
+        return self.vesselDialog
+
     def intensityChanged(self):
         bim = 1
         if self.ui.cbBrightImage.isChecked():
@@ -124,13 +269,230 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.lblIntensity.setText(str(self.ui.sliderIntensity.value()*bim)+'%')
         intmax = (self.ui.sliderIntensity.value() / 100.0) * bim
         self.plotWindow.image.changeIntensity(intmax, relative=True)
-        self.plotWindow.syntheticImageUpdated()
 
-    def loadFile(self, filename):
+        # Redraws are coalesced, since this is called for every
+        # step of the slider while it is dragged
+        self.plotWindow.requestRedraw()
+
+    def loadFile(self, filename, incremental=False):
+        """
+        Load the named file in the background, and show it when
+        it has been loaded. Any load already in progress is cancelled.
+
+        incremental: If True, the image already shown is updated with
+                     the new data, keeping zoom, overlays and captions.
+        """
         self.ui.txtFilename.setText(filename)
-        self.filename = filename
+        if filename != self.filename:
+            self.filename = filename
+            self.updateWatcher()
+
+        # Recently shown files are taken from the dataset cache
+        imgtype = self.imageType
+        data = getDatasetCache().get(DatasetCache.fileKey(filename, imgtype))
+        if data is not None:
+            self._stopLoader()
+            self.imageFileLoaded(data, incremental)
+            return
+
+        self.startLoader(lambda progress : SyntheticImage.readImageFile(filename, imgtype, lazy=True, cache=True, progress=progress),
+                         lambda data : self.imageFileLoaded(self.cacheFileData(filename, data), incremental))
+        self._loadingFile = True
+
+    def cacheFileData(self, filename, data):
+        """
+        Store the data read from the named file in the dataset cache.
+        The HDF5 file kept open by a lazy load is left out, since it
+        is closed when the next file is loaded (memory-mapped arrays
+        remain valid after that).
+        """
+        data = dict(data)
+        h5file = data.pop('_h5file', None)
+
+        # Data of earlier versions of the file will never be used again
+        cache = getDatasetCache()
+        cache.removeOutdated(filename, data['_fileSignature'])
+        cache.put(DatasetCache.fileKey(filename, data['imageType'], data['_fileSignature']), dict(data))
+
+        if h5file is not None:
+            data['_h5file'] = h5file
+
+        return data
+
+    def imageFileLoaded(self, data, incremental=False):
+        # Leave the scan (if one is open)
+        self.stack = None
+        if self.stackViewer is not None:
+            self.stackViewer.hide()
+
+        self._fileData = {k: v for k, v in data.items() if k != '_h5file'}
+        self.plotWindow.image.setImageFileData(data)
+        self.showImage(incremental)
+
+        if self.fileBrowser is not None and self.fileBrowser.isVisible():
+            self.fileBrowser.setCurrentFile(self.filename)
+            self.prefetchNeighbours(self.filename)
+
+    def loadScan(self, filenames):
+        """
+        Load the named SOFT outputs (e.g. of a scan over pitch angle,
+        energy or time) as one image stack in the background, and
+        show it in the stack viewer when it has been loaded. The
+        outputs are only read the first time the scan is opened;
+        after that, the stack is memory-mapped from the cache.
+        """
+        from ImageStack import ImageStack
+        stack = ImageStack(filenames, self.imageType)
+
+        self.startLoader(stack.load, self.scanLoaded)
+
+    def scanLoaded(self, stack):
+        self.stack = stack
+        self._fileData = None
+
+        # The frames are not watched for changes
+        self.filename = ""
+        self.updateWatcher()
+
+        viewer = self.getStackViewer()
+        viewer.setStack(stack)
+
+        self.plotWindow.image.setImageFileData(stack.getBaseData())
+        self.setFrame(viewer.getFrame())
+        self.showImage()
+
+        viewer.show()
+        viewer.raise_()
+
+    def setFrame(self, i):
+        """
+        Show frame 'i' of the open scan in the plot (without
+        redrawing it), normalized as selected in the stack viewer.
+        """
+        stack, image = self.stack, self.plotWindow.image
+        if self.stackViewer.isNormalizedPerFrame():
+            image.setFrame(stack.getFrame(i), stack.getMax(i), stack.getMin(i))
+        else:
+            image.setFrame(stack.getFrame(i), stack.getMax(), stack.getMin())
+
+        self.ui.txtFilename.setText(stack.getFilename(i))
+
+    def showFrame(self, i):
+        if self.stack is None:
+            return
 
-        self.plotWindow.image.loadImageFile(filename, self.imageType)
+        self.setFrame(i)
+        self.statusBar().showMessage("Max value = "+str(self.stack.getMax(i)))
+
+        # Only the data of the plotted image is replaced, and redraws
+        # are coalesced, since this is called for every step of the
+        # slider while it is dragged
+        self.plotWindow.requestRedraw(hard=True)
+
+    def prefetchNeighbours(self, filename):
+        """
+        Load the files next to the given file in the file browser
+        into the dataset cache in the background, so that stepping
+        to them is instant.
+        """
+        for loader in self._prefetchers:
+            loader.cancel()
+        self._prefetchers = []
+
+        for f in self.fileBrowser.getNeighbours(filename, MainWindow.PREFETCH):
+            if DatasetCache.fileKey(f, self.imageType) not in getDatasetCache():
+                self.startPrefetch(f, self.imageType)
+
+    def startPrefetch(self, filename, imgtype):
+        loader = ImageLoader(lambda progress : SyntheticImage.readImageFile(filename, imgtype, lazy=True, cache=True, progress=progress))
+        loader.loaded.connect(lambda data : self.prefetchFinished(loader, filename, data))
+        loader.finished.connect(lambda : self._loaders.discard(loader))
+
+        self._prefetchers.append(loader)
+        self._loaders.add(loader)
+
+        loader.start()
+
+    def prefetchFinished(self, loader, filename, data):
+        # Files no longer next to the current file are not cached
+        # (the loader may be cancelled after emitting its result)
+        if not loader.isCancelled():
+            data = self.cacheFileData(filename, data)
+
+        if '_h5file' in data:
+            data['_h5file'].close()
+
+    def startLoader(self, task, apply):
+        """
+        Run 'task' (see 'ImageLoader') in a background thread, and
+        pass its result on to 'apply' before showing the image.
+        Any load already in progress is cancelled.
+        """
+        self._stopLoader()
+
+        loader = ImageLoader(task)
+        loader.progress.connect(lambda value, text : self.loadProgress(loader, value, text))
+        loader.loaded.connect(lambda data : self.loadFinished(loader, data, apply))
+        loader.failed.connect(lambda msg : self.loadFailed(loader, msg))
+        loader.finished.connect(lambda : self._loaders.discard(loader))
+
+        self._loader = loader
+        self._loaders.add(loader)
+        self.showLoadProgress(True)
+
+        loader.start()
+
+    def cancelLoad(self):
+        """
+        Cancel any load in progress. A cancelled loader is left to
+        finish its current step, but its result is discarded.
+        """
+        if self._loader is None:
+            return
+
+        self._stopLoader()
+        self.statusBar().showMessage('Loading cancelled', 3000)
+
+    def _stopLoader(self):
+        if self._loader is not None:
+            self._loader.cancel()
+
+        self._loader = None
+        self._loadingFile = False
+        self.showLoadProgress(False)
+
+    def loadProgress(self, loader, value, text):
+        if loader is not self._loader:
+            return
+
+        self.progressBar.setValue(value)
+        self.statusBar().showMessage(text)
+
+    def loadFinished(self, loader, data, apply):
+        # Discard the results of stale loads
+        if loader is not self._loader:
+            if isinstance(data, dict) and '_h5file' in data:
+                data['_h5file'].close()
+            return
+
+        self._stopLoader()
+        apply(data)
+
+    def loadFailed(self, loader, msg):
+        if loader is not self._loader:
+            return
+
+        self._stopLoader()
+
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, 'Unable to load image', msg)
+
+    def showLoadProgress(self, show):
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(show)
+        self.btnCancelLoad.setVisible(show)
+
+    def showImage(self, incremental=False):
         imageMax = self.plotWindow.image.getImageMax()
 
         # Enable overlay checkboxes
@@ -147,7 +509,43 @@ class MainWindow(QtWidgets.QMainWindow):
             #self.statusBar().showMessage("Successfully loaded "+filename, 3000)
             self.statusBar().showMessage("Max value = "+str(imageMax))
 
-        self.refreshImage()
+        if incremental and self.plotWindow.isVisible():
+            self.plotWindow.syntheticImageUpdated(True)
+        else:
+            self.refreshImage()
+
+        self.showTimings()
+        self.showCacheStatistics()
+        self.imageShown.emit()
+
+    def showCacheStatistics(self):
+        """
+        Show the memory used by the dataset cache in the status
+        bar (and all its statistics in the tooltip).
+        """
+        stats = getDatasetCache().getStatistics()
+        MiB = 1024**2
+
+        self.lblCache.setText('Cache {0:.0f}/{1:.0f} MiB'.format(stats['size']/MiB, stats['budget']/MiB))
+        self.lblCache.setToolTip('Datasets cached: {0}/{1}\nHits: {2}\nMisses: {3}\nEvictions: {4}'.format(
+            stats['entries'], stats['maxEntries'], stats['hits'], stats['misses'], stats['evictions']))
+
+    def showTimings(self):
+        """
+        Show the time spent in the latest load and draw
+        of the image in the status bar.
+        """
+        profiler = getSessionProfiler()
+        timings = []
+        for stage in MainWindow.TIMED_STAGES:
+            # Files are also loaded in the background (prefetched),
+            # so take the load of the file shown
+            info = self.filename if stage == 'load' else None
+            record = profiler.getLast(stage, info)
+            if record is not None:
+                timings.append('{0} {1:.2f} s'.format(stage, record['time']))
+
+        self.lblTimings.setText(', '.join(timings))
 
     def openFile(self):
         filename, _ = QFileDialog.getOpenFileName(parent=self, caption="Open SOFT image file", filter="SOFT Output (*.dat *.h5 *.hdf5 *.mat *.sdt);;All files (*.*)")
@@ -155,6 +553,12 @@ class MainWindow(QtWidgets.QMainWindow):
         if filename:
             self.loadFile(filename)
 
+    def openScan(self):
+        filenames, _ = QFileDialog.getOpenFileNames(parent=self, caption="Open SOFT outputs of a scan", filter="SOFT Output (*.dat *.h5 *.hdf5 *.mat *.sdt);;All files (*.*)")
+
+        if filenames:
+            self.loadScan(sorted(filenames))
+
     def refreshImage(self):
         if not self.plotWindow.isVisible():
             self.plotWindow.show()
@@ -172,13 +576,32 @@ class MainWindow(QtWidgets.QMainWindow):
             QMessageBox.information(self, 'No image open', 'No SOFT image file is currently open, thus there is no image to save. Please, open an image file!')
             return
 
-        filename, _ = QFileDialog.getSaveFileName(self, caption='Save SOFT image', filter='Encapsulated Post-Script (*.eps);;Portable Network Graphics (*.png);;Portable Document Format (*.pdf);;Scalable Vector Graphics (*.svg)')
+        # Raster formats saved at native resolution (and their bit depths)
+        rasterFilters = {
+            'Image pixels only, PNG (*.png)': 8,
+            'Image pixels only, TIFF (*.tif *.tiff)': 8,
+            'Image pixels only, 16-bit gray scale TIFF (*.tif *.tiff)': 16,
+            'Image pixels only, 32-bit float TIFF (*.tif *.tiff)': 'float'
+        }
 
-        if filename:
+        # Timings of all stages of loading and plotting, for bug reports
+        profileFilter = 'Timing profile, JSON (*.json)'
+
+        filters = ['Encapsulated Post-Script (*.eps)', 'Portable Network Graphics (*.png)', 'Portable Document Format (*.pdf)', 'Scalable Vector Graphics (*.svg)']
+        filename, selectedFilter = QFileDialog.getSaveFileName(self, caption='Save SOFT image', filter=';;'.join(filters + list(rasterFilters.keys()) + [profileFilter]))
+
+        if not filename:
+            return
+
+        if selectedFilter == profileFilter:
+            getSessionProfiler().dump(filename)
+        elif selectedFilter in rasterFilters:
+            self.plotWindow.image.exportRaster(filename, depth=rasterFilters[selectedFilter])
+        else:
             self.plotWindow.image.savePlot(filename)
 
     def setCaption(self):
-        self.captionDialog.show()
+        self.getCaptionDialog().show()
 
     def setColormap(self):
         cmname = self.ui.cbColormap.currentText()
@@ -189,12 +612,50 @@ class MainWindow(QtWidgets.QMainWindow):
             self.plotWindow.image.setColormap(cmname)
             self.plotWindow.syntheticImageUpdated(True)
 
+        self.updateFileBrowser()
+
     def setImageType(self):
         self.imageType = ImageType(self.ui.cbImageType.currentText())
-        self.reloadFile()
+        image = self.plotWindow.image
+        self.updateFileBrowser()
+
+        if self._loadingFile:
+            # Restart the load with the new image type
+            self.loadFile(self.filename)
+        elif self.stack is not None:
+            # Scans are consolidated separately for each image type
+            self.loadScan(self.stack.getFilenames())
+        elif image.isPolarized():
+            # Polarization quantities are derived from the Stokes
+            # parameters already in memory (or taken from the cache)
+            stokes, imgtype = image.stokes, self.imageType
+            key = DatasetCache.fileKey(self.filename, imgtype, image.getFileSignature())
+            data = getDatasetCache().get(key)
+            if data is not None:
+                self.imageTypeLoaded(data)
+            else:
+                self.startLoader(lambda progress : SyntheticImage.readImageType(stokes, imgtype, progress=progress),
+                                 lambda data : self.imageTypeLoaded(data, key))
+        else:
+            image.setImageType(self.imageType)
+
+    def imageTypeLoaded(self, data, key=None):
+        """
+        Show a newly derived polarization quantity. If 'key' is
+        given, the data is stored in the dataset cache (together
+        with the Stokes parameters it was derived from).
+        """
+        derived = {k: data[k] for k in ['imageType', 'imageData', '_imageMax']}
+        if self._fileData is not None:
+            self._fileData = dict(self._fileData, **derived)
+            if key is not None:
+                getDatasetCache().put(key, self._fileData)
+
+        self.plotWindow.image.updateImageData(derived)
+        self.showImage()
 
     def setWallOverlay(self):
-        self.vesselDialog.show()
+        self.getVesselDialog().show()
 
     def showSeparatrix(self):
         if self.ui.cbSeparatrix.isChecked():
@@ -202,7 +663,7 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             self.plotWindow.image.removeSeparatrix()
 
-        self.plotWindow.syntheticImageUpdated()
+        self.plotWindow.overlaysUpdated()
     
     def showTopview(self):
         if self.ui.cbTopview.isChecked():
@@ -210,7 +671,7 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             self.plotWindow.image.removeTopview()
 
-        self.plotWindow.syntheticImageUpdated()
+        self.plotWindow.overlaysUpdated()
     
     def showWallCrossSection(self):
         if self.ui.cbWallCross.isChecked():
@@ -218,7 +679,7 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             self.plotWindow.image.removeWallCrossSection()
 
-        self.plotWindow.syntheticImageUpdated()
+        self.plotWindow.overlaysUpdated()
     
     def toggleColorbar(self):
         self.plotWindow.image.toggleColorbar(self.ui.cbColorbar.isChecked())
@@ -238,9 +699,83 @@ class MainWindow(QtWidgets.QMainWindow):
             self.plotWindow.image.toggleLogarithmic(False)
 
         self.plotWindow.syntheticImageUpdated(True)
+        self.updateFileBrowser()
 
     def vesselUpdated(self, status):
         self.plotWindow.image.setOverlays(status)
         self.plotWindow.image.plotOverlays()
-        self.plotWindow.syntheticImageUpdated()
+        self.plotWindow.overlaysUpdated()
+
+    def toggleWatch(self):
+        self.updateWatcher()
+
+        # Pick up any changes made before watching started
+        if self.ui.cbWatch.isChecked():
+            self.watchedFileChanged()
+
+    def updateWatcher(self):
+        """
+        Watch the open file (if watching is enabled). The directory
+        is watched as well, since files are often replaced rather
+        than modified in place, which ends the watch of the file.
+        """
+        paths = self.watcher.files() + self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+
+        self._watchSignature = None
+        self.watchTimer.stop()
+
+        if not self.ui.cbWatch.isChecked() or self.filename == "":
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        self.watcher.addPath(directory)
+        if os.path.isfile(self.filename):
+            self.watcher.addPath(self.filename)
+
+    def watchedFileChanged(self, path=None):
+        """
+        Called whenever the watched file (or its directory) changes.
+        Bursts of changes are collapsed into one check, made once the
+        file has been left alone for 'WATCH_INTERVAL' ms.
+        """
+        if not self.ui.cbWatch.isChecked():
+            return
+
+        # Re-add the file if it was replaced
+        if self.filename not in self.watcher.files() and os.path.isfile(self.filename):
+            self.watcher.addPath(self.filename)
+
+        self.watchTimer.start()
+
+    def checkWatchedFile(self):
+        """
+        Reload the watched file if it has changed since it was last
+        read, it has not changed since the previous check and it is
+        consistent (i.e. not in the middle of being written).
+        """
+        if not self.ui.cbWatch.isChecked():
+            return
+
+        # Check again when the current load is done
+        if self._loadingFile:
+            self.watchTimer.start()
+            return
+
+        signature = softio.fileSignature(self.filename)
+        if signature is None or signature == self.plotWindow.image.getFileSignature():
+            return
+
+        # Changed since the previous check: wait until it settles
+        if signature != self._watchSignature:
+            self._watchSignature = signature
+            self.watchTimer.start()
+            return
+
+        # Incomplete file: wait for the next change
+        if not softio.isConsistent(self.filename):
+            return
 
+        self._watchSignature = None
+        self.loadFile(self.filename, incremental=True)
@@ -1,9 +1,9 @@
 from PyQt5 import QtWidgets
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QMessageBox
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 import matplotlib
-import numpy as np
+import matplotlib.ticker
+import time
 from SyntheticImage import SyntheticImage
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -12,6 +12,10 @@ from matplotlib.figure import Figure
 
 
 class PlotWindow(QtWidgets.QFrame):
+
+    # Maximum number of redraws per second (see 'requestRedraw')
+    MAX_FRAME_RATE = 60
+
     def __init__(self, parent=None):
         super(PlotWindow, self).__init__(parent)
 
@@ -19,8 +23,21 @@ class PlotWindow(QtWidgets.QFrame):
         self.canvas = FigureCanvas(self.figure)
         self.toolbar = NavigationToolbar(self.canvas, self)
         self.image = SyntheticImage(self.figure, self.canvas)
+        self.image.animatedOverlays = True
         self.setWindowTitle('Synthetic synchrotron image')
 
+        # Rendered figure without overlays, used for blitting
+        self._background = None
+        self._backgroundLimits = None
+        self.canvas.mpl_connect('draw_event', self._onDraw)
+
+        # Coalesced redraws
+        self._hardRedraw = False    # Update the image data at the next redraw?
+        self._lastRedraw = 0
+        self._redrawTimer = QTimer()
+        self._redrawTimer.setSingleShot(True)
+        self._redrawTimer.timeout.connect(self._redraw)
+
         layout = QtWidgets.QVBoxLayout()
         layout.addWidget(self.toolbar)
         layout.addWidget(self.canvas)
@@ -37,10 +54,56 @@ class PlotWindow(QtWidgets.QFrame):
             msg.setStandardButtons(QMessageBox.Ok)
             msg.exec_()
     
+    def overlaysUpdated(self):
+        """
+        Redraw only the overlays on top of the cached image,
+        without re-rendering the rest of the figure.
+        """
+        if not self.image.hasImage(): return
+
+        # Overlays may change the axis limits, in which
+        # case the whole figure must be redrawn
+        if self._background is None or self._backgroundLimits != self._getLimits():
+            self.drawSafe()
+            return
+
+        self.canvas.restore_region(self._background)
+        self._drawOverlays()
+        self.canvas.blit(self.figure.bbox)
+
     def plotImage(self):
         self.image.assembleImage()
         self.drawSafe()
 
+    def requestRedraw(self, hard=False):
+        """
+        Redraw the figure as soon as possible, but at most
+        'MAX_FRAME_RATE' times per second. Requests made while a
+        redraw is pending are merged into it, so that only the latest
+        state is drawn, however many requests are made.
+
+        hard: If True, the image data has changed, and the plotted
+              image is updated (see 'SyntheticImage.updateImage')
+              before redrawing.
+        """
+        if not self.image.hasImage():
+            return
+
+        self._hardRedraw = self._hardRedraw or hard
+        if self._redrawTimer.isActive():
+            return
+
+        wait = 1.0/PlotWindow.MAX_FRAME_RATE - (time.perf_counter() - self._lastRedraw)
+        self._redrawTimer.start(max(0, int(1000*wait)))
+
+    def setPreview(self, preview):
+        """
+        Toggle preview mode (see 'SyntheticImage.setPreview'), e.g.
+        while a slider is being dragged.
+        """
+        if self.image.setPreview(preview):
+            self.requestRedraw()
+
     def set_colormax(self, intmax=1):
         self.image.changeIntensity(intmax)
 
@@ -73,11 +136,45 @@ class PlotWindow(QtWidgets.QFrame):
 
     def setSyntheticImage(self, image):
         self.image = image
+        self.image.animatedOverlays = True
+        self._background = None
 
     def syntheticImageUpdated(self, hard=False):
         if not self.image.hasImage(): return
         if hard:
-            self.image.assembleImage()
+            self.image.updateImage()
+
+        self.drawSafe()
+
+    def _redraw(self):
+        self._lastRedraw = time.perf_counter()
+        if self._hardRedraw:
+            self._hardRedraw = False
+            self.image.updateImage()
 
         self.drawSafe()
 
+    def _drawOverlays(self):
+        for h in self.image.getOverlayHandles():
+            h.set_animated(True)
+            self.figure.draw_artist(h)
+
+    def _onDraw(self, event):
+        """
+        Called after every full redraw of the figure. Stores the
+        rendered figure (which excludes the animated overlays) and
+        draws the overlays on top of it.
+        """
+        if self.canvas.is_saving():
+            return
+
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._backgroundLimits = self._getLimits()
+        self._drawOverlays()
+
+    def _getLimits(self):
+        if self.image.axes is None:
+            return None
+        else:
+            return (self.image.axes.get_xlim(), self.image.axes.get_ylim())
+
@@ -1,11 +1,13 @@
 
 import numpy as np
-import scipy.io
-import h5py
-import matplotlib.pyplot as plt
-from matplotlib.colors import LinearSegmentedColormap
 from enum import Enum
 
+import colormaps
+
+from Profiler import profiled
+from softio import h5stack, imageSlices, sliceExtent
+from Stokes import Stokes
+
 class ImageType(Enum):
     EMPTY = 'N/A'
     I = 'I'
@@ -26,13 +28,39 @@ class ImageType(Enum):
     DIAGONAL2 = 'Diagonal 2'
 
 class PolarizedImage:
+
+    # Stokes parameter from which each quantity is derived, and
+    # how: 1 = positive part, -1 = negative part, 0 = both signs,
+    # 2/-2 = half the sum/difference with I, None = special.
+    QUANTITY_TYPES = {
+        ImageType.I:          ('I', 1),
+        ImageType.POSQ:       ('Q', 1),
+        ImageType.NEGQ:       ('Q', -1),
+        ImageType.PMQ:        ('Q', 0),
+        ImageType.POSU:       ('U', 1),
+        ImageType.NEGU:       ('U', -1),
+        ImageType.PMU:        ('U', 0),
+        ImageType.POSV:       ('V', 1),
+        ImageType.NEGV:       ('V', -1),
+        ImageType.PMV:        ('V', 0),
+        ImageType.LINPOLFRAC: (None, None),
+        ImageType.POLANGLE:   (None, None),
+        ImageType.HORIZONTAL: ('Q', 2),
+        ImageType.VERTICAL:   ('Q', -2),
+        ImageType.DIAGONAL1:  ('U', 2),
+        ImageType.DIAGONAL2:  ('U', -2)
+    }
     
     def __init__(self, figure=None, canvas=None, registerGeriMap=True):
+        self.dtype = None       # Data type used for computed images (None = as stored)
         self.images = []
         self.imageType = [0]*8
         self.nRows = 1          # Number of image rows
         self.nCols = 1          # Number of image columns
         self._colorbar = None
+        self._imageShape = None     # Shape of the full image (of which only a region may be loaded)
+        self._imageSlices = None    # Slices (rows, cols) of the full image loaded (None = all)
+        self._quantities = {}   # Polarization quantities computed by 'assembleImage'
 
         self.canvas = canvas
         self.figure = figure
@@ -42,12 +70,14 @@ class PolarizedImage:
         self.labeXLoc, self.labelYLoc = 0.9, 0.9
         self.labelHorizontalAlignment = 'right'
 
+        self.stokes = None      # 'Stokes' object holding all Stokes parameters
         self.StokesI, self.StokesQ, self.StokesU, self.StokesV = None, None, None, None
         self.detectorPosition = np.array([0, 0, 0])
         self.detectorDirection = np.array([0, 0, 0])
         self.detectorVisang = 0
 
         if self.figure is None:
+            import matplotlib.pyplot as plt
             self.figure = plt.gca().figure
             self.figure.patch.set_facecolor('black')
             if self.canvas is not None:
@@ -92,6 +122,10 @@ class PolarizedImage:
         self.clearImage()
         self.axes = []
         self.images = [0] * (self.nRows*self.nCols)
+
+        # Compute all quantities to show in one go
+        n = min(self.nRows*self.nCols, len(self.imageType))
+        self._quantities = PolarizedImage.getPolarizationQuantities(self.imageType[:n], self._getStokes(), dtype=self.dtype)
         
         for i in range(0, self.nRows*self.nCols):
             self.axes.append(self.figure.add_subplot(self.nRows, self.nCols, i+1))
@@ -99,33 +133,46 @@ class PolarizedImage:
             if i < len(self.imageType):
                 self.plotImage(i, border, plotLabel)
 
-    def loadPolarizedImage(self, filename):
+    def loadPolarizedImage(self, filename, region=None, stride=None, dtype=None):
         """
         Load output from the SOFT 'polimage' sycout.
+
+        region: Only load the given region of interest of the
+                images, as a tuple ((row0, row1), (col0, col1)) of
+                pixel ranges (in the images as they are plotted).
+        stride: Only load every n'th pixel of the images (an
+                integer, or a tuple (rowstride, colstride)).
+        dtype:  Data type to store the Stokes parameters as (e.g.
+                np.float32 to halve the memory used). Defaults to
+                the data type used in the file.
         """
+        self._imageSlices = None
+
         if filename.endswith('.mat'):
             try:
-                self._loadMatFile(filename)
+                self._loadMatFile(filename, region, stride, dtype)
             except NotImplementedError: 
-                self._loadHDF5File(filename)
+                self._loadHDF5File(filename, region, stride, dtype)
         elif filename.endswith('.h5') or filename.endswith('.hdf5'):
-            self._loadHDF5File(filename)
+            self._loadHDF5File(filename, region, stride, dtype)
         else:
             raise NotImplementedError('Unrecognized file format of file: '+filename)
 
-    def _loadMatFile(self, filename):
+    def _loadMatFile(self, filename, region=None, stride=None, dtype=None):
         """
         Load a legacy Matlab file.
         """
+        import scipy.io
         matfile = scipy.io.loadmat(filename)
 
-        self.StokesI = np.transpose(matfile['StokesI'])
-        self.StokesQ = np.transpose(matfile['StokesQ'])
-        self.StokesU = np.transpose(matfile['StokesU'])
-        self.StokesV = np.transpose(matfile['StokesV'])
-        self.detectorPosition = matfile['detectorPosition'][0]
-        self.detectorDirection = matfile['detectorDirection'][0]
-        self.detectorVisang = matfile['detectorVisang']
+        self._imageShape = np.shape(np.transpose(matfile['StokesI']))
+        self._imageSlices = imageSlices(self._imageShape, region, stride)
+        s = self._imageSlices if self._imageSlices is not None else Ellipsis
+
+        self.setStokes(Stokes.fromArrays(*[np.transpose(matfile['Stokes'+c])[s] for c in Stokes.COMPONENTS], dtype=dtype,
+            detectorPosition=matfile['detectorPosition'][0],
+            detectorDirection=matfile['detectorDirection'][0],
+            detectorVisang=matfile['detectorVisang']))
 
         try: self.wall = np.transpose(matfile['wall'])
         except KeyError: pass
@@ -133,20 +180,23 @@ class PolarizedImage:
         try: self.wall = np.transpose(matfile['separatrix'])
         except KeyError: pass
 
-    def _loadHDF5File(self, filename):
+    def _loadHDF5File(self, filename, region=None, stride=None, dtype=None):
         """
         Load a HDF5 file.
         Used also for modern Matlab files.
         """
-        matfile = h5py.File(filename)
+        import h5py
+        matfile = h5py.File(filename, 'r')
 
-        self.StokesI = np.transpose(matfile['StokesI'][:,:])
-        self.StokesQ = np.transpose(matfile['StokesQ'][:,:])
-        self.StokesU = np.transpose(matfile['StokesU'][:,:])
-        self.StokesV = np.transpose(matfile['StokesV'][:,:])
-        self.detectorPosition = matfile['detectorPosition'][:,0]
-        self.detectorDirection = matfile['detectorDirection'][:,0]
-        self.detectorVisang = matfile['detectorVisang'][0,0]
+        # Only read the selected region from file
+        self._imageShape = tuple(reversed(matfile['StokesI'].shape))
+        self._imageSlices = imageSlices(self._imageShape, region, stride)
+
+        data = h5stack([matfile['Stokes'+c] for c in Stokes.COMPONENTS], self._imageSlices, dtype=dtype)
+        self.setStokes(Stokes(data,
+            detectorPosition=matfile['detectorPosition'][:,0],
+            detectorDirection=matfile['detectorDirection'][:,0],
+            detectorVisang=matfile['detectorVisang'][0,0]))
 
         try: self.wall = matfile['wall'][:,:]
         except KeyError: pass
@@ -154,108 +204,152 @@ class PolarizedImage:
         try: self.separatrix = matfile['separatrix'][:,:]
         except KeyError: pass
 
+    def setStokes(self, stokes):
+        """
+        Set the Stokes parameters (a 'Stokes' object) to plot.
+        """
+        self.stokes = stokes
+        self.StokesI, self.StokesQ, self.StokesU, self.StokesV = stokes
+        self.detectorPosition = stokes.detectorPosition
+        self.detectorDirection = stokes.detectorDirection
+        self.detectorVisang = stokes.detectorVisang
+
+    def _getStokes(self):
+        """
+        Returns the 'Stokes' object to plot, creating it if the
+        'StokesI/Q/U/V' attributes have been set directly.
+        """
+        if self.stokes is None or any([a is not b for a, b in zip(self.stokes, (self.StokesI, self.StokesQ, self.StokesU, self.StokesV))]):
+            self.setStokes(Stokes.fromArrays(self.StokesI, self.StokesQ, self.StokesU, self.StokesV,
+                detectorPosition=self.detectorPosition, detectorDirection=self.detectorDirection,
+                detectorVisang=self.detectorVisang))
+
+        return self.stokes
+
     @staticmethod
-    def getPolarizationQuantity(imgtype, I, Q, U, V):
+    def getPolarizationQuantity(imgtype, stokes):
         """
         Returns the polarization quantity corresponding
-        to the given image type.
+        to the given image type, computed from the given
+        'Stokes' object.
+
+        NOTE: For the types I, +-Q, +-U and +-V the returned
+        image is the given Stokes array itself (not a copy).
         """
-        img = np.zeros(np.shape(I))
-        intmin, intmax = 0, 1
-
-        if imgtype == ImageType.I:
-            img = np.copy(I)
-            intmin, intmax = 0, np.amax(I)
-        elif imgtype == ImageType.POSQ:
-            img = np.copy(Q)
-            img[img < 0] = 0
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.NEGQ:
-            img = -np.copy(Q)
-            img[img < 0] = 0
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.PMQ:
-            img = np.copy(Q)
-            mn, mx = np.amin(img), np.amax(img)
-            if mn < 0:
-                if abs(mn) > mx:
-                    intmin, intmax = mn, -mn
-                else:
-                    intmin, intmax = -mx, mx
+        if imgtype not in PolarizedImage.QUANTITY_TYPES:
+            return np.zeros(stokes.shape), 0, 1
+
+        return PolarizedImage.getPolarizationQuantities([imgtype], stokes)[imgtype]
+
+    @staticmethod
+    @profiled('derive')
+    def getPolarizationQuantities(imgtypes, stokes, out=None, dtype=None):
+        """
+        Computes several polarization quantities in one go, from the
+        given 'Stokes' object. All operations are done in-place in the
+        output arrays, and the extrema of the Stokes parameters are
+        taken from the (cached) statistics of 'stokes'.
+
+        imgtypes: List of 'ImageType's to compute ('EMPTY' is ignored).
+        out:      Optional dict mapping 'ImageType's to preallocated
+                  output arrays (of the same shape as the Stokes arrays).
+        dtype:    Data type of the computed images (e.g. np.float32).
+                  Defaults to the data type of the Stokes parameters.
+
+        Returns a dict mapping each 'ImageType' to a tuple
+        (img, intmin, intmax), where 'intmin' and 'intmax' are the
+        color limits to use for the image.
+        """
+        if out is None: out = {}
+        if dtype is None: dtype = stokes.dtype
+
+        I, Q, U, V = stokes
+        getExtrema = lambda name : stokes.getStatistics(name)[:2]
+
+        def getBuffer(imgtype):
+            if imgtype in out:
+                return out[imgtype]
             else:
-                intmin, intmax = 0, max(mn, mx)
-        elif imgtype == ImageType.POSU:
-            img = np.copy(U)
-            img[img < 0] = 0
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.NEGU:
-            img = -np.copy(U)
-            img[img < 0] = 0
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.PMU:
-            img = np.copy(U)
-            mn, mx = np.amin(img), np.amax(img)
-            if mn < 0:
-                if abs(mn) > mx:
-                    intmin, intmax = mn, -mn
-                else:
-                    intmin, intmax = -mx, mx
+                return np.empty(stokes.shape, dtype=dtype)
+
+        def getStokes(imgtype, name):
+            # Use the Stokes array directly, unless an output
+            # buffer or another data type was requested
+            component = stokes.getComponent(name)
+            if imgtype in out:
+                np.copyto(out[imgtype], component, casting='same_kind')
+                return out[imgtype]
+            elif component.dtype != dtype:
+                return component.astype(dtype)
             else:
-                intmin, intmax = 0, max(mn, mx)
-        elif imgtype == ImageType.POSV:
-            img = np.copy(V)
-            img[img < 0] = 0
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.NEGV:
-            img = -np.copy(V)
-            img[img < 0] = 0
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.PMV:
-            img = np.copy(V)
-            mn, mx = np.amin(img), np.amax(img)
-            if mn < 0:
-                if abs(mn) > mx:
-                    intmin, intmax = mn, -mn
+                return component
+
+        quantities = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for imgtype in imgtypes:
+                if imgtype in quantities or imgtype not in PolarizedImage.QUANTITY_TYPES:
+                    continue
+
+                name, sign = PolarizedImage.QUANTITY_TYPES[imgtype]
+
+                if imgtype == ImageType.I:
+                    img = getStokes(imgtype, 'I')
+                    intmin, intmax = 0, getExtrema('I')[1]
+                elif sign == 1:
+                    img = np.maximum(stokes.getComponent(name), 0, out=getBuffer(imgtype))
+                    intmin, intmax = 0, max(getExtrema(name)[1], 0)
+                elif sign == -1:
+                    img = np.negative(stokes.getComponent(name), out=getBuffer(imgtype))
+                    np.maximum(img, 0, out=img)
+                    intmin, intmax = 0, max(-getExtrema(name)[0], 0)
+                elif sign == 0:
+                    img = getStokes(imgtype, name)
+                    mn, mx = getExtrema(name)
+                    if mn < 0:
+                        if abs(mn) > mx:
+                            intmin, intmax = mn, -mn
+                        else:
+                            intmin, intmax = -mx, mx
+                    else:
+                        intmin, intmax = 0, max(mn, mx)
+                elif imgtype == ImageType.LINPOLFRAC:
+                    img = np.hypot(U, Q, out=getBuffer(imgtype))
+                    np.divide(img, I, out=img)
+                    np.nan_to_num(img, copy=False)
+                    intmin, intmax = 0, 1
+                elif imgtype == ImageType.POLANGLE:
+                    img = np.arctan2(U, Q, out=getBuffer(imgtype))
+                    np.multiply(img, 0.5 * 180/np.pi, out=img)
+                    np.nan_to_num(img, copy=False)
+                    intmin, intmax = -90, 90
                 else:
-                    intmin, intmax = -mx, mx
-            else:
-                intmin, intmax = 0, max(mn, mx)
-        elif imgtype == ImageType.LINPOLFRAC:
-            img = np.sqrt(U**2 + Q**2) / I
-            img = np.nan_to_num(img)
-            intmin, intmax = 0, 1
-        elif imgtype == ImageType.POLANGLE:
-            img = 0.5 * np.arctan2(U, Q) * 180/np.pi
-            img = np.nan_to_num(img)
-            intmin, intmax = -90, 90
-        elif imgtype == ImageType.HORIZONTAL:
-            img = 0.5 * (I + Q)
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.VERTICAL:
-            img = 0.5 * (I - Q)
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.DIAGONAL1:
-            img = 0.5 * (I + U)
-            intmin, intmax = 0, np.amax(img)
-        elif imgtype == ImageType.DIAGONAL2:
-            img = 0.5 * (I - U)
-            intmin, intmax = 0, np.amax(img)
-
-        return img, intmin, intmax
+                    # Horizontal, vertical and diagonal components
+                    img = getBuffer(imgtype)
+                    if sign == 2:
+                        np.add(I, stokes.getComponent(name), out=img)
+                    else:
+                        np.subtract(I, stokes.getComponent(name), out=img)
+                    np.multiply(img, 0.5, out=img)
+                    intmin, intmax = 0, np.amax(img)
+
+                quantities[imgtype] = (img, intmin, intmax)
+
+        return quantities
 
     def plotImage(self, index, border=True, plotLabel=True):
         imgtype = self.imageType[index]
         ax = self.axes[index]
-        colormap = plt.get_cmap(self.colormapName)
+        colormap = colormaps.getColormap(self.colormapName)
 
-        img = np.zeros(self.StokesI)
-        intmin, intmax = 0, 1
         if imgtype == ImageType.EMPTY:
             return
+        elif imgtype in self._quantities:
+            img, intmin, intmax = self._quantities[imgtype]
         else:
-            img, intmin, intmax = PolarizedImage.getPolarizationQuantity(imgtype, self.StokesI, self.StokesQ, self.StokesU, self.StokesV)
+            img, intmin, intmax = PolarizedImage.getPolarizationQuantity(imgtype, self._getStokes())
 
-        self.images[index] = ax.imshow(img, origin='lower', cmap=colormap, interpolation=None, clim=(intmin, intmax), extent=[0,1,0,1])
+        extent = sliceExtent([0,1,0,1], self._imageShape, self._imageSlices, origin='lower')
+        self.images[index] = ax.imshow(img, origin='lower', cmap=colormap, interpolation=None, clim=(intmin, intmax), extent=extent)
         #ax.set_axis_off()
         if border:
             ax.spines['bottom'].set_color('white')
@@ -297,14 +391,9 @@ class PolarizedImage:
     def registerGeriMap():
         """
         Register the perceptually uniform colormap 'GeriMap' with matplotlib
+        (once per process).
         """
-        gm = [(0, 0, 0), (.15, .15, .5), (.3, .15, .75),
-              (.6, .2, .50), (1, .25, .15), (.9, .5, 0),
-              (.9, .75, .1), (.9, .9, .5), (1, 1, 1)]
-        gerimap = LinearSegmentedColormap.from_list('GeriMap', gm)
-        gerimap_r = LinearSegmentedColormap.from_list('GeriMap_r', gm[::-1])
-        plt.register_cmap(cmap=gerimap)
-        plt.register_cmap(cmap=gerimap_r)
+        colormaps.registerGeriMap()
 
     def save(self, filename, dpi=100, supertight=True):
 
@@ -0,0 +1,255 @@
+# SOFT PROFILER
+#
+# Records the time (and, optionally, memory) spent in each stage
+# of loading and plotting an image, such as reading the file,
+# deriving polarization quantities or drawing the figure. The
+# most recent records are kept in a ring buffer, which can be
+# summarized, or dumped to a JSON file to attach to bug reports.
+#
+# Usage:
+#   profiler = getSessionProfiler()
+#   with profiler.stage('load', filename):
+#       ...
+#   print(profiler.getSummary())
+#
+
+import collections
+import datetime
+import functools
+import json
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class Profiler:
+
+    # Default number of records kept
+    SIZE = 1000
+
+    def __init__(self, size=SIZE, traceMemory=False):
+        """
+        Create a new profiler.
+
+        size:        Number of records to keep. When full, the
+                     oldest records are discarded.
+        traceMemory: If True, the change in allocated memory is
+                     recorded for each stage (see 'setTraceMemory').
+        """
+        self.enabled = True
+        self.records = collections.deque(maxlen=size)
+        self.startTime = time.perf_counter()
+        self.startDate = datetime.datetime.now()
+
+        self._local = threading.local()     # Nesting depth of stages, per thread
+        self._startedTracing = False        # Was tracemalloc started by this profiler?
+
+        self.traceMemory = False
+        if traceMemory:
+            self.setTraceMemory(True)
+
+    def clear(self):
+        """
+        Remove all records.
+        """
+        self.records.clear()
+
+    def getRecords(self, stage=None):
+        """
+        Returns a list of all records (of the given stage, if
+        specified), oldest first. Each record is a dict with the
+        keys
+
+          stage:  Name of the stage.
+          info:   Extra information given (e.g. a file name), or None.
+          start:  Time (s) since the session started.
+          time:   Wall time (s) spent in the stage.
+          memory: Net memory (bytes) allocated in the stage, or None
+                  if memory is not traced.
+          depth:  Number of stages this stage is nested in.
+          thread: Name of the thread the stage ran in.
+        """
+        records = list(self.records)
+        if stage is None:
+            return records
+        else:
+            return [r for r in records if r['stage'] == stage]
+
+    def getLast(self, stage, info=None):
+        """
+        Returns the most recent record of the given stage (or
+        None if the stage has not been recorded).
+
+        info: If given, only records with this extra information
+              (e.g. a file name) are considered.
+        """
+        # Records may be added by other threads while searching
+        for r in reversed(list(self.records)):
+            if r['stage'] == stage and (info is None or r['info'] == info):
+                return r
+
+        return None
+
+    def getSummary(self):
+        """
+        Returns a dict with the number of records ('count') and the
+        total, mean, maximum and last wall time ('total', 'mean',
+        'max', 'last') of each stage.
+        """
+        summary = collections.OrderedDict()
+        for r in list(self.records):
+            if r['stage'] not in summary:
+                summary[r['stage']] = {'count': 0, 'total': 0, 'max': 0}
+
+            s = summary[r['stage']]
+            s['count'] += 1
+            s['total'] += r['time']
+            s['max'] = max(s['max'], r['time'])
+            s['last'] = r['time']
+
+        for s in summary.values():
+            s['mean'] = s['total'] / s['count']
+
+        return summary
+
+    def isTracingMemory(self): return self.traceMemory
+
+    def setEnabled(self, enabled): self.enabled = enabled
+
+    def setTraceMemory(self, trace):
+        """
+        Enable or disable recording of memory allocations. Note that
+        tracing memory slows down the program considerably.
+        """
+        self.traceMemory = trace
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._startedTracing = True
+        elif not trace and self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+
+    def stage(self, name, info=None):
+        """
+        Returns a context manager recording the time spent in
+        the 'with' block as a stage with the given name.
+
+        name: Name of the stage.
+        info: Extra information to store (e.g. a file name).
+        """
+        return _Stage(self, name, info)
+
+    def toDict(self):
+        """
+        Returns all records and a summary of them, together with
+        information about the system, as a JSON serializable dict.
+        """
+        import matplotlib
+        import numpy as np
+
+        return {
+            'meta': {
+                'date': self.startDate.isoformat(timespec='seconds'),
+                'duration': time.perf_counter() - self.startTime,
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'matplotlib': matplotlib.__version__,
+                'platform': platform.platform(),
+                'argv': sys.argv,
+                'traceMemory': self.traceMemory
+            },
+            'summary': self.getSummary(),
+            'records': self.getRecords()
+        }
+
+    def dump(self, filename):
+        """
+        Write all records to the named JSON file.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.toDict(), f, indent=2)
+
+    def _getDepth(self):
+        return getattr(self._local, 'depth', 0)
+
+    def _setDepth(self, depth):
+        self._local.depth = depth
+
+
+class _Stage:
+    """
+    Context manager recording one stage (see 'Profiler.stage').
+    """
+    def __init__(self, profiler, name, info):
+        self.profiler = profiler
+        self.name = name
+        self.info = info
+
+    def __enter__(self):
+        p = self.profiler
+        self.recording = p.enabled
+        if not self.recording:
+            return self
+
+        self.depth = p._getDepth()
+        p._setDepth(self.depth+1)
+
+        self.memory = tracemalloc.get_traced_memory()[0] if p.traceMemory else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        p = self.profiler
+        if not self.recording:
+            return False
+
+        end = time.perf_counter()
+        memory = None
+        if self.memory is not None and tracemalloc.is_tracing():
+            memory = tracemalloc.get_traced_memory()[0] - self.memory
+
+        p._setDepth(self.depth)
+        p.records.append({
+            'stage': self.name,
+            'info': self.info,
+            'start': self.start - p.startTime,
+            'time': end - self.start,
+            'memory': memory,
+            'depth': self.depth,
+            'thread': threading.current_thread().name
+        })
+
+        return False
+
+
+# Profiler used by all images of this process
+_sessionProfiler = Profiler()
+
+
+def getSessionProfiler():
+    """
+    Returns the profiler of this session (process).
+    """
+    return _sessionProfiler
+
+
+def profiled(name, info=None):
+    """
+    Decorator recording each call to the decorated function as
+    a stage with the given name, using the session profiler.
+
+    info: Optional function returning the extra information to
+          record, given the arguments of the decorated function.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with _sessionProfiler.stage(name, None if info is None else info(*args, **kwargs)):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
@@ -0,0 +1,92 @@
+# SOFT STACK VIEWER
+#
+# Window with a slider for scrubbing through the frames of an
+# image stack (see 'ImageStack.py'), e.g. the images of a scan
+# over pitch angle, energy or time.
+#
+
+import os
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt, pyqtSignal
+
+
+class StackViewer(QtWidgets.QWidget):
+    frameChanged = pyqtSignal(int)
+    normalizationChanged = pyqtSignal()
+
+    # Normalizations of the frames: relative to the maximum of
+    # all frames, or of each frame separately
+    GLOBAL = 'Global'
+    PER_FRAME = 'Per frame'
+
+    def __init__(self, parent=None):
+        """
+        Create a new (empty) stack viewer.
+        """
+        QtWidgets.QWidget.__init__(self, parent)
+        self.setWindowTitle('SOFT scan')
+        self.resize(560, 100)
+
+        self.stack = None
+
+        self.lblFrame = QtWidgets.QLabel()
+        self.cbNormalization = QtWidgets.QComboBox()
+        self.cbNormalization.addItem(StackViewer.GLOBAL)
+        self.cbNormalization.addItem(StackViewer.PER_FRAME)
+
+        self.slider = QtWidgets.QSlider(Qt.Horizontal)
+        self.slider.setRange(0, 0)
+        self.slider.setPageStep(10)
+
+        top = QtWidgets.QHBoxLayout()
+        top.addWidget(self.lblFrame, 1)
+        top.addWidget(QtWidgets.QLabel('Normalization:'))
+        top.addWidget(self.cbNormalization)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(top)
+        layout.addWidget(self.slider)
+        self.setLayout(layout)
+
+        self.slider.valueChanged.connect(self._sliderMoved)
+        self.cbNormalization.currentIndexChanged.connect(lambda : self.normalizationChanged.emit())
+
+    def getFrame(self): return self.slider.value()
+    def isNormalizedPerFrame(self): return self.cbNormalization.currentText() == StackViewer.PER_FRAME
+
+    def setFrame(self, i):
+        """
+        Move the slider to frame 'i' (emitting 'frameChanged').
+        """
+        self.slider.setValue(i)
+
+    def setStack(self, stack):
+        """
+        Show the given (loaded) 'ImageStack'. The current frame
+        is kept if it is in the new stack.
+        """
+        self.stack = stack
+
+        self.slider.blockSignals(True)
+        self.slider.setRange(0, len(stack)-1)
+        self.slider.blockSignals(False)
+
+        self._updateLabel()
+
+    def _sliderMoved(self, value):
+        self._updateLabel()
+        self.frameChanged.emit(value)
+
+    def _updateLabel(self):
+        if self.stack is None:
+            self.lblFrame.setText('')
+            return
+
+        i = self.getFrame()
+        filename = self.stack.getFilename(i)
+
+        self.lblFrame.setText('{0}/{1}: {2}'.format(i+1, len(self.stack), os.path.basename(filename)))
+        self.lblFrame.setToolTip(filename)
+
+
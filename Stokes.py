@@ -0,0 +1,93 @@
+# SOFT STOKES PARAMETERS
+#
+# Container for the four Stokes parameters (I, Q, U, V) of a
+# polarized SOFT image. All four parameters are stored in one
+# block of memory (or memory-mapped from the file, as one region
+# or one region per parameter), together with the detector setup
+# of the image and statistics of each parameter, which are
+# computed only once.
+#
+
+import numpy as np
+
+class Stokes:
+
+    # Names of the Stokes parameters, in the order they are stored
+    COMPONENTS = ['I', 'Q', 'U', 'V']
+
+    def __init__(self, data, detectorPosition=None, detectorDirection=None, detectorVisang=None, detectorRoll=0):
+        """
+        Create a new set of Stokes parameters.
+
+        data: Array of shape (4, ny, nx) containing I, Q, U and V
+              (in that order), oriented as they are plotted. The
+              attributes 'I', 'Q', 'U' and 'V' are views of 'data'.
+              May also be a list of four (ny, nx) arrays, e.g. when
+              each parameter is memory-mapped separately.
+        """
+        if isinstance(data, (list, tuple)):
+            if len(data) != 4 or any([np.shape(d) != np.shape(data[0]) or np.ndim(d) != 2 for d in data]):
+                raise ValueError("Invalid shapes of Stokes parameter arrays: {0}. Expected four arrays of shape (ny, nx).".format([np.shape(d) for d in data]))
+
+            self.dtype = np.result_type(*data)
+            self.shape = np.shape(data[0])
+        elif np.ndim(data) != 3 or np.shape(data)[0] != 4:
+            raise ValueError("Invalid shape of Stokes parameter array: {0}. Expected (4, ny, nx).".format(np.shape(data)))
+        else:
+            self.dtype = data.dtype
+            self.shape = data.shape[1:]
+
+        self.data = data
+        self.I, self.Q, self.U, self.V = data[0], data[1], data[2], data[3]
+
+        self.detectorPosition = detectorPosition
+        self.detectorDirection = detectorDirection
+        self.detectorVisang = detectorVisang
+        self.detectorRoll = detectorRoll
+
+        self._statistics = {}   # Cached (min, max, sum) of each parameter
+
+    def __iter__(self):
+        return iter((self.I, self.Q, self.U, self.V))
+
+    def getComponent(self, name):
+        """
+        Returns the named Stokes parameter ('I', 'Q', 'U' or 'V').
+        """
+        return self.data[Stokes.COMPONENTS.index(name)]
+
+    def getStatistics(self, name):
+        """
+        Returns a tuple (min, max, sum) for the named Stokes
+        parameter. The statistics are computed on the first call
+        and cached, since the parameters never change.
+        """
+        if name not in self._statistics:
+            c = self.getComponent(name)
+            self._statistics[name] = (np.amin(c), np.amax(c), np.sum(c))
+
+        return self._statistics[name]
+
+    def min(self, name): return self.getStatistics(name)[0]
+    def max(self, name): return self.getStatistics(name)[1]
+    def sum(self, name): return self.getStatistics(name)[2]
+
+    @staticmethod
+    def fromArrays(I, Q, U, V, dtype=None, **kwargs):
+        """
+        Create a 'Stokes' object by copying four separate arrays into
+        one block of memory. Any keyword arguments (detector setup)
+        are passed on to the constructor.
+
+        dtype: Data type to store the parameters as (e.g. np.float32).
+               Defaults to the common data type of the arrays.
+        """
+        if dtype is None:
+            dtype = np.result_type(I, Q, U, V)
+
+        data = np.empty((4,)+np.shape(I), dtype=dtype)
+        for i, arr in enumerate((I, Q, U, V)):
+            data[i] = arr
+
+        return Stokes(data, **kwargs)
+
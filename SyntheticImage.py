@@ -4,19 +4,28 @@
 # with overlays etc. using Python's matplotlib.
 #
 
-import h5py
-import matplotlib.pyplot as plt
 import numpy as np
-import scipy.io
-from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.collections import LineCollection
+import matplotlib.colors
 import matplotlib.ticker
+import os.path
+import colormaps
+from Camera import Camera
+from ImagePyramid import ImagePyramid
 from PolarizedImage import ImageType, PolarizedImage
+from Profiler import getSessionProfiler, profiled
+from softio import GEOMETRY, fileSignature, h5stack, h5view, h5read, imageSlices, loadText, sliceExtent
+from Stokes import Stokes
+
+# Value used for log10(0) in logarithmic images
+LOG_ZERO_LEVEL = np.log10(np.finfo(float).tiny)
 
 class SyntheticImage:
     
     def __init__(self, figure=None, canvas=None, registerGeriMap=True, gerimapTransparencyThreshold=None):
         # PROPERTIES
         self.canvas = canvas
+        self.animatedOverlays = False   # Draw overlays as animated artists (for blitting)?
         self.captions = []
         self.colorbar = False
         self.colorbarRelative = True
@@ -38,17 +47,41 @@ class SyntheticImage:
         self.overlayTopviewOrthogonalCrossSection  = False
         self.imageData = None
         self.imageIntensityMax = 1      # Ceiling of colormap
+        self.imageType = ImageType.I    # Polarization quantity shown (polarized images only)
         self.logarithmic = False
+        self.pyramidReduction = 'mean'  # Downsampling of large images ('mean' or 'max')
+        self.pyramidThreshold = 2048    # Show large images through an image pyramid (None = never)
+        self.previewSize = 512          # Largest side of the image shown in preview mode
         self.separatrix = None
+        self.stokes = None              # Stokes parameters ('Stokes' object) of polarized images
         self.wall = None
         self.wall_rmax = None
         self.wall_rmin = None
 
         # Internal properties
+        self._camera = None             # Cached camera for the current detector setup
+        self._imageMin = None           # Cached minimum of 'imageData'
+        self._imageMinSource = None     # 'imageData' for which '_imageMin' was computed
+        self._logImage = None           # Cached logarithm of 'imageData' (or of the pyramid level shown)
+        self._logImageSource = None     # Data for which '_logImage' was computed
+        self._plottedData = None        # Data last passed to the image handle
+        self._plottedLevel = None       # Pyramid level (before masking) of '_plottedData'
+        self._fullResolution = False    # Always show level 0 of image pyramids?
+        self._preview = False           # Show a coarse image pyramid level (for quick redraws)?
+        self._pyramidLevel = 0          # Image pyramid level currently shown
+        self._pyramids = []             # Image pyramids of the most recently shown data
+        self._pyramidView = None        # Region of an image pyramid level currently shown
+        self._displayExtent = None      # Extent of the data currently shown
         self._colorbar = None
+        self._fileSignature = None      # Size and mtime of the loaded file when it was read
         self._detectorNormalHandle = None
         self._fluxOverlayHandles = []   # Matplotlib handles to flux overlays
+        self._h5file = None             # HDF5 file kept open when loading lazily
+        self._image = None              # Matplotlib handle to the image
         self._imageMax = 0              # Max intensity of image
+        self._imageShape = None         # Shape of the full image (of which only a region may be loaded)
+        self._imageSlices = None        # Slices (rows, cols) of the full image loaded (None = all)
+        self._overlayInput = None       # Geometry/data the current overlays were plotted with
         self._separatrixOverlayHandle = None
         self._topviewOCSHandle = None
         self._topviewOverlayHandles = None
@@ -56,6 +89,7 @@ class SyntheticImage:
         self._wallCrossSectionOverlayHandle = None
 
         if self.figure is None:
+            import matplotlib.pyplot as plt
             self.figure = plt.gca().figure
             self.figure.patch.set_facecolor('black')
             if self.canvas is not None:
@@ -65,6 +99,9 @@ class SyntheticImage:
 
         self.axes = None
 
+        # Show the appropriate image pyramid level when resized
+        self.canvas.mpl_connect('resize_event', self._viewChanged)
+
         if registerGeriMap:
             SyntheticImage.registerGeriMap(transparencyThreshold=gerimapTransparencyThreshold)
 
@@ -73,11 +110,41 @@ class SyntheticImage:
     # GETTERS
     #
     #####################################################
+    def getCamera(self):
+        """
+        Returns a 'Camera' object for the current detector setup.
+        The camera is only recreated when the setup changes.
+        """
+        if self._camera is None or not self._camera.matches(self.detectorPosition, self.detectorDirection, self.detectorRoll, self.detectorVisang):
+            self._camera = Camera(self.detectorPosition, self.detectorDirection, self.detectorRoll, self.detectorVisang)
+
+        return self._camera
+
+    def getFileSignature(self): return self._fileSignature
+    def getProfiler(self): return getSessionProfiler()
     def getImageMax(self): return self._imageMax
+    def getOverlayHandles(self):
+        """
+        Returns a list of the matplotlib handles of all
+        overlays currently plotted.
+        """
+        handles = list(self._fluxOverlayHandles)
+        for h in [self._detectorNormalHandle, self._separatrixOverlayHandle,
+                  self._topviewOCSHandle, self._wallCrossSectionOverlayHandle]:
+            if h is not None:
+                handles.append(h)
+
+        for h in [self._topviewOverlayHandles, self._topviewSeparatrixOverlayHandles]:
+            if h is not None:
+                handles += list(h)
+
+        return handles
+
     def hasImage(self): return self.imageData is not None
     def hasSeparatrix(self): return self.separatrix is not None
     def hasTopview(self): return self.hasWall()
     def hasWall(self): return self.wall is not None
+    def isPolarized(self): return self.stokes is not None
 
     #####################################################
     #
@@ -88,8 +155,32 @@ class SyntheticImage:
     def setColormap(self, cmname): self.colormapName = cmname
     def setDetector(self, direction, position, visionangle, roll=0): self.detectorDirection, self.detectorPosition, self.detectorVisang, self.detectorRoll = direction, position, visionangle, roll
     def setFluxSurfaces(self, flux): self.flux = flux
-    def setImage(self, image): self.imageData = image
+    def setImage(self, image): self.imageData, self.stokes, self._imageSlices = image, None, None
+    def setImageType(self, imgtype):
+        """
+        Change which polarization quantity to show. The quantity is
+        derived from the Stokes parameters kept in memory, so no file
+        is re-read. Returns True if the image data changed.
+        """
+        self.imageType = imgtype
+        if self.stokes is None:
+            return False
+
+        self.updateImageData(SyntheticImage.readImageType(self.stokes, imgtype))
+        return True
+
     def setMaskLevel(self, level=None): self.maskLevel = level
+    def setPreview(self, preview):
+        """
+        Toggle preview mode, in which a coarse version of the image
+        (no larger than 'previewSize') is shown so that the figure
+        can be redrawn quickly, e.g. while dragging a slider. Returns
+        True if the image data shown changed (the caller must then
+        redraw the figure).
+        """
+        self._preview = preview
+        return self._updatePyramidLevel()
+
     def setSeparatrix(self, separatrix): self.separatrix = separatrix
     def setWall(self, wall): self.wall, self.wall_rmax, self.wall_rmin = wall, np.amax(wall[0,:]), np.amin(wall[0,:])
 
@@ -116,6 +207,7 @@ class SyntheticImage:
 
         # Plot overlays
         self.plotOverlays()
+        self._overlayInput = self._getOverlayInput()
 
         # Add colorbar
         if self.colorbar:
@@ -124,6 +216,46 @@ class SyntheticImage:
         # Add captions
         self.plotCaptions()
 
+        # Don't let overlays extend the view beyond a region of interest
+        if self._imageSlices is not None:
+            self.limitExtents()
+
+    def updateImage(self):
+        """
+        Update an already assembled image with the current image
+        data, colormap, color limits and mask, without clearing the
+        figure. Overlays are only re-plotted if the geometry they
+        depend on has changed, and captions are kept as they are.
+        If no image has been assembled yet, this is equivalent to
+        calling 'assembleImage'.
+        """
+        if self._image is None or self.axes is None:
+            self.assembleImage()
+            return
+
+        imageData, intmin, intmax, zorder = self._getPlotData()
+
+        if imageData is not self._plottedData:
+            self._image.set_data(imageData)
+            self._plottedData = imageData
+
+        self._image.set_cmap(colormaps.getColormap(self.colormapName))
+        self._image.set_clim(intmin, intmax)
+        self._image.set_zorder(zorder)
+        self._setDisplayExtent()
+
+        # Re-plot overlays if their input has changed
+        overlayInput = self._getOverlayInput()
+        if not self._isSameOverlayInput(overlayInput, self._overlayInput):
+            self.plotOverlays()
+            self._overlayInput = overlayInput
+
+        if self._colorbar is not None:
+            self._colorbar.update_normal(self._image)
+            self._setColorbarTicks()
+        elif self.colorbar:
+            self.plotColorbar()
+
     def changeIntensity(self, maxIntensity, relative=False):
         """
         Change the intensity of an already plotted image
@@ -149,152 +281,287 @@ class SyntheticImage:
         self._image.set_clim(vmin=zerolevel, vmax=intmax)
         #self.canvas.draw_idle()
 
+    def closeFile(self):
+        """
+        Close any HDF5 file kept open by a lazy load.
+        """
+        if self._h5file is not None:
+            self._h5file.close()
+            self._h5file = None
+
     def limitExtents(self):
-        extent = self._getImageExtent()
+        extent = self._getDataExtent()
         self.axes.set_xlim(extent[0], extent[1])
         self.axes.set_ylim(extent[2], extent[3])
 
-    def loadImageFile(self, filename, imgtype=ImageType.I):
+    def loadImageFile(self, filename, imgtype=ImageType.I, lazy=False, cache=False, region=None, stride=None, dtype=None):
         """
-        Load a SOFT image file.
+        Load a SOFT image file (or a part of it).
 
         filename: Name of file to load.
         imgtype:  Type of image to load (applicable only to
                   polarized images)
+        lazy:     If True, HDF5 files are kept open and their
+                  image datasets memory-mapped (when the layout
+                  allows it) instead of being read up front.
+        cache:    If True, legacy text images are cached in a
+                  binary format, making subsequent loads fast.
+        region:   Only load the given region of interest of the
+                  image, as a tuple ((row0, row1), (col0, col1)) of
+                  pixel ranges (in the image as it is plotted).
+        stride:   Only load every n'th pixel of the image (an
+                  integer, or a tuple (rowstride, colstride)).
+        dtype:    Data type to store the Stokes parameters of
+                  polarized images as (e.g. np.float32). Defaults
+                  to the data type used in the file.
+
+        For HDF5 files, the region and stride are passed on to HDF5,
+        so that only the selected parts of the file are read. The
+        image is shown at its place within the full image, so that
+        overlays remain correctly registered.
+        """
+        self.setImageFileData(SyntheticImage.readImageFile(filename, imgtype, lazy, cache, region, stride, dtype))
+
+    def setImageFileData(self, data):
+        """
+        Use the image (and geometry) read by 'readImageFile'. Any
+        HDF5 file kept open by a previous lazy load is closed.
+        """
+        self.closeFile()
+        self.stokes = None
+        self._fileSignature = None
+        self._imageSlices = None
+
+        self.updateImageData(data)
+
+    def updateImageData(self, data):
+        """
+        Set the attributes given in the dict 'data' (as returned by
+        'readImageFile' or 'readImageType').
         """
+        for key, value in data.items():
+            setattr(self, key, value)
+
+        self._intmax = self._imageMax
+
+    def setFrame(self, image, imageMax=None, imageMin=None):
+        """
+        Replace only the image data (e.g. with a frame of an
+        'ImageStack'), keeping the geometry and overlays. Call
+        'updateImage' to show the new frame.
+
+        image:    New image data.
+        imageMax: Intensity shown at 100% intensity (default:
+                  maximum of 'image').
+        imageMin: Minimum of the image data, if already known.
+        """
+        self.imageData, self.stokes = image, None
+        self._imageMax = np.amax(image) if imageMax is None else imageMax
+        self._intmax = self._imageMax
+
+        if imageMin is not None:
+            self._imageMin, self._imageMinSource = imageMin, image
+
+    @staticmethod
+    def readImageType(stokes, imgtype, progress=None):
+        """
+        Derive the given polarization quantity from the Stokes
+        parameters 'stokes' (a 'Stokes' object). Like 'readImageFile',
+        this does not modify any 'SyntheticImage' and returns a dict
+        to pass on to 'updateImageData'.
+        """
+        if progress is None:
+            progress = lambda fraction, text : None
+
+        progress(0, 'Computing polarization quantity')
+        imageData, _, _ = PolarizedImage.getPolarizationQuantity(imgtype, stokes)
+
+        progress(0.9, 'Computing image maximum')
+        data = {'imageType': imgtype, 'imageData': imageData, '_imageMax': np.amax(imageData)}
+
+        progress(1, 'Done')
+        return data
+
+    @staticmethod
+    @profiled('load', info=lambda filename, *args, **kwargs : filename)
+    def readImageFile(filename, imgtype=ImageType.I, lazy=False, cache=False, region=None, stride=None, dtype=None, progress=None):
+        """
+        Read a SOFT image file (see 'loadImageFile' for details on
+        the arguments), without modifying any 'SyntheticImage'. The
+        polarization quantity to show and the maximum of the image
+        are also computed. Since nothing is plotted, this may be
+        called from a background thread.
+
+        Returns a dict mapping names of 'SyntheticImage' attributes
+        to their new values, to be passed on to 'setImageFileData'.
+
+        progress: Optional function 'progress(fraction, text)' which
+                  is called as the file is read. It may raise an
+                  exception to abort reading.
+        """
+        if progress is None:
+            progress = lambda fraction, text : None
+
+        # Stat before reading, so that any changes made while
+        # reading are detected by comparing with the signature
+        data = {'imageType': imgtype, '_fileSignature': fileSignature(filename)}
+        progress(0, 'Reading '+filename)
+
         # DAT-file: for legacy support
         if filename.endswith('.dat') or filename.endswith('.topview'):
-            self.imageData = np.genfromtxt(filename)
+            data['imageData'] = SyntheticImage._sliceImage(data, loadText(filename, cache=cache), region, stride)
         elif filename.endswith('.mat'):
             # First, try to load old-style MAT file
             try:
+                import scipy.io
                 matfile = scipy.io.loadmat(filename)
+                progress(0.5, 'Processing '+filename)
 
                 if 'image' in matfile:
-                    self.imageData = np.transpose(matfile['image'])
-                elif 'StokesI' in matfile:
-                    I = np.transpose(matfile['StokesI'])
-                    Q = np.transpose(matfile['StokesQ'])
-                    U = np.transpose(matfile['StokesU'])
-                    V = np.transpose(matfile['StokesV'])
+                    data['imageData'] = SyntheticImage._sliceImage(data, np.transpose(matfile['image']), region, stride)
 
-                    self.imageData, _, _ = PolarizedImage.getPolarizationQuantity(imgtype, I, Q, U, V)
+                data['detectorPosition'] = matfile['detectorPosition'][0]
+                data['detectorDirection'] = matfile['detectorDirection'][0]
+                data['detectorVisang'] = matfile['detectorVisang'][0][0]
 
-                self.detectorPosition = matfile['detectorPosition'][0]
-                self.detectorDirection = matfile['detectorDirection'][0]
-                self.detectorVisang = matfile['detectorVisang'][0][0]
-
-                try: self.detectorRoll = matfile['detectorRoll'][0][0]
+                try: data['detectorRoll'] = matfile['detectorRoll'][0][0]
                 except KeyError: pass
 
+                if 'StokesI' in matfile and 'image' not in matfile:
+                    data['stokes'] = Stokes.fromArrays(*[SyntheticImage._sliceImage(data, np.transpose(matfile['Stokes'+c]), region, stride) for c in Stokes.COMPONENTS],
+                                                       dtype=dtype, **SyntheticImage._getGeometry(data))
+                    data['imageData'], _, _ = PolarizedImage.getPolarizationQuantity(imgtype, data['stokes'])
+
                 try:
-                    self.wall = matfile['wall']
-                    if self.wall.shape[0] == 2:
-                        self.wall = np.transpose(self.wall)
+                    data['wall'] = matfile['wall']
+                    if data['wall'].shape[0] == 2:
+                        data['wall'] = np.transpose(data['wall'])
                 except KeyError: pass
 
-                try: self.separatrix = matfile['separatrix']
+                try: data['separatrix'] = matfile['separatrix']
                 except KeyError: pass
 
             # Otherwise, load modern (HDF5-based) MAT-file
             except NotImplementedError:
-                self._loadHDF5(filename, imgtype)
-
-            self.wall_rmax = np.amax(self.wall[:,0])
-            self.wall_rmin = np.amin(self.wall[:,0])
+                SyntheticImage._readHDF5(data, filename, imgtype, lazy, region, stride, dtype, progress)
         elif filename.endswith('.h5') or filename.endswith('.hdf5'):
-            self._loadHDF5(filename, imgtype)
-
-            self.wall_rmax = np.amax(self.wall[:,0])
-            self.wall_rmin = np.amin(self.wall[:,0])
+            SyntheticImage._readHDF5(data, filename, imgtype, lazy, region, stride, dtype, progress)
         else:
             raise NotImplementedError("Unrecognized image format. Unable to load file.")
 
-        self._imageMax = np.amax(self.imageData)
-        self._intmax = self._imageMax
+        if 'wall' in data:
+            data['wall_rmax'] = np.amax(data['wall'][:,0])
+            data['wall_rmin'] = np.amin(data['wall'][:,0])
+
+        # With lazy loading, this is when the image is actually read
+        progress(0.9, 'Computing image maximum')
+        try:
+            data['_imageMax'] = np.amax(data['imageData'])
+        except BaseException:
+            if '_h5file' in data:
+                data['_h5file'].close()
+            raise
 
-    def _loadHDF5(self, filename, imgtype=ImageType.I):
+        progress(1, 'Done')
+        return data
+
+    @staticmethod
+    def _readHDF5(data, filename, imgtype=ImageType.I, lazy=False, region=None, stride=None, dtype=None, progress=None):
+        """
+        Read a HDF5 file (used also for modern Matlab files) into
+        the dict 'data'. If 'lazy' is True, the file is kept open
+        and stored in 'data' as well.
+        """
+        import h5py
         matfile = h5py.File(filename, 'r')
 
+        try:
+            SyntheticImage._readHDF5Data(data, matfile, imgtype, lazy, region, stride, dtype, progress)
+        except BaseException:
+            matfile.close()
+            raise
+
+        if lazy:
+            data['_h5file'] = matfile
+        else:
+            matfile.close()
+
+    @staticmethod
+    def _readHDF5Data(data, matfile, imgtype, lazy, region, stride, dtype, progress):
+        """
+        Read the contents of the open HDF5 file 'matfile' into 'data'.
+        """
+        name = 'image' if 'image' in matfile else 'StokesI'
+        if name in matfile:
+            data['_imageShape'] = tuple(reversed(matfile[name].shape))
+            data['_imageSlices'] = imageSlices(data['_imageShape'], region, stride)
+
+        slices = data.get('_imageSlices')
+        if lazy:
+            read = lambda ds : h5view(ds, slices)
+        else:
+            read = lambda ds : h5read(ds, slices)
+
+        stokes = None
         if 'image' in matfile:
-            self.imageData = np.transpose(matfile['image'][:,:])
+            data['imageData'] = read(matfile['image'])
         elif 'StokesI' in matfile:
-            I = np.transpose(matfile['StokesI'][:,:])
-            Q = np.transpose(matfile['StokesQ'][:,:])
-            U = np.transpose(matfile['StokesU'][:,:])
-            V = np.transpose(matfile['StokesV'][:,:])
-
-            self.imageData, _, _ = PolarizedImage.getPolarizationQuantity(imgtype, I, Q, U, V)
+            progress(0, 'Reading Stokes parameters')
+            stokes = h5stack([matfile['Stokes'+c] for c in Stokes.COMPONENTS], slices, dtype=dtype, lazy=lazy,
+                             progress=lambda f : progress(0.8*f, 'Reading Stokes parameters'))
 
-        self.detectorPosition = matfile['detectorPosition'][:]
-        self.detectorDirection = matfile['detectorDirection'][:]
+        data['detectorPosition'] = matfile['detectorPosition'][:]
+        data['detectorDirection'] = matfile['detectorDirection'][:]
 
         if len(matfile['detectorVisang'].shape) == 2:
-            self.detectorVisang = matfile['detectorVisang'][0,0]
+            data['detectorVisang'] = matfile['detectorVisang'][0,0]
         else:
-            self.detectorVisang = matfile['detectorVisang'][0]
+            data['detectorVisang'] = matfile['detectorVisang'][0]
 
-        try: self.detectorRoll = matfile['detectorRoll'][:][0]
+        try: data['detectorRoll'] = matfile['detectorRoll'][:][0]
         except KeyError: pass
 
-        if len(self.detectorPosition.shape) == 2:
-            if self.detectorPosition.shape[0] == 3:
-                self.detectorPosition = self.detectorPosition.reshape((1,3))
-            if self.detectorDirection.shape[0] == 3:
-                self.detectorDirection = self.detectorDirection.reshape((1,3))
+        if len(data['detectorPosition'].shape) == 2:
+            if data['detectorPosition'].shape[0] == 3:
+                data['detectorPosition'] = data['detectorPosition'].reshape((1,3))
+            if data['detectorDirection'].shape[0] == 3:
+                data['detectorDirection'] = data['detectorDirection'].reshape((1,3))
 
-            self.detectorPosition = self.detectorPosition[0]
-            self.detectorDirection = self.detectorDirection[0]
+            data['detectorPosition'] = data['detectorPosition'][0]
+            data['detectorDirection'] = data['detectorDirection'][0]
 
         try:
-            self.wall = matfile['wall'][:,:]
-            if self.wall.shape[0] == 2:
-                self.wall = np.transpose(self.wall)
+            data['wall'] = matfile['wall'][:,:]
+            if data['wall'].shape[0] == 2:
+                data['wall'] = np.transpose(data['wall'])
         except KeyError: pass
 
         try:
-            self.separatrix = matfile['separatrix'][:,:]
-            if self.separatrix.shape[0] == 2:
-                self.separatrix = np.transpose(self.separatrix)
+            data['separatrix'] = matfile['separatrix'][:,:]
+            if data['separatrix'].shape[0] == 2:
+                data['separatrix'] = np.transpose(data['separatrix'])
         except KeyError: pass
 
+        if stokes is not None:
+            progress(0.8, 'Computing polarization quantity')
+            data['stokes'] = Stokes(stokes, **SyntheticImage._getGeometry(data))
+            data['imageData'], _, _ = PolarizedImage.getPolarizationQuantity(imgtype, data['stokes'])
+
     @staticmethod
     def registerGeriMap(transparencyThreshold=0.4):
         """
         Register the perceptually uniform colormap 'GeriMap' with matplotlib
+        (see 'colormaps.registerGeriMap'). The colormap is only built once
+        per process.
 
         transparencyThreshold: All intensities below this threshold will have
                                a non-zero alpha value (making them more or
                                less transparent). The opacity varies linearly,
                                being 1 at this value, and 0 at zero.
         """
-        gm = [(0, 0, 0), (.15, .15, .5), (.3, .15, .75),
-              (.6, .2, .50), (1, .25, .15), (.9, .5, 0),
-              (.9, .75, .1), (.9, .9, .5), (1, 1, 1)]
-        gerimap = LinearSegmentedColormap.from_list('GeriMap', gm)
-        gerimap_r = LinearSegmentedColormap.from_list('GeriMap_r', gm[::-1])
-
-        if transparencyThreshold is not None:
-            n = int(gerimap.N * transparencyThreshold)
-            nn = gerimap.N - n
-
-            if n < 0 or nn < 0:
-                raise ValueError('Transparency threshold must be a value between 0 and 1.')
-
-            a = np.linspace(0, 1, n)
-            b = np.ones((nn,))
-
-            gmap = gerimap(np.arange(gerimap.N))
-            gmap[:,-1] = np.concatenate((a,b), axis=None)
-            gerimap = LinearSegmentedColormap.from_list('GeriMap', gmap)
-
-            gmap_r = gerimap_r(np.arange(gerimap.N))
-            gmap_r[:,-1] = np.concatenate((a,b), axis=None)
-            gerimap_r = LinearSegmentedColormap.from_list('GeriMap_r', gmap_r)
-
-        plt.register_cmap(cmap=gerimap)
-        plt.register_cmap(cmap=gerimap_r)
+        colormaps.registerGeriMap(transparencyThreshold)
 
+    @profiled('save')
     def savePlot(self, filename):
         #self.axes.margins(0,0)
         #self.axes.get_xaxis().set_visible(False)
@@ -309,11 +576,120 @@ class SyntheticImage:
 
         fcolor = self.figure.patch.get_facecolor()
 
+        # Animated artists are not included when saving
+        self._setOverlaysAnimated(False)
+        # Always save the full resolution image
+        self._fullResolution = True
+        self._viewChanged()
+
         #self.canvas.print_figure(filename, bbox_inches='tight', pad_inches=0, facecolor='black')
-        self.canvas.print_figure(filename, bbox_inches='tight', pad_inches=0, facecolor=fcolor, dpi=600)
+        try:
+            self.canvas.print_figure(filename, bbox_inches='tight', pad_inches=0, facecolor=fcolor, dpi=600)
+        finally:
+            self._setOverlaysAnimated(self.animatedOverlays)
+            self._fullResolution = False
+            self._viewChanged()
+
+    @profiled('save')
+    def exportRaster(self, filename, depth=8):
+        """
+        Save the image at its native resolution (one pixel per image
+        pixel), without overlays, captions or colorbar. The colormap,
+        color limits, logarithmic scale and mask level are applied
+        directly to the pixel data, which is much faster than
+        rendering the figure with 'savePlot'.
+
+        filename: Name of file to save to. The format is determined
+                  by the extension (e.g. '.png' or '.tif').
+        depth:    8 to save a colormapped RGBA image, 16 to save the
+                  normalized intensity (0-65535) as a 16-bit gray
+                  scale image, or 'float' to save the (possibly
+                  logarithmized) image data as 32-bit floats (TIFF
+                  only). Masked pixels are transparent, 0 and NaN,
+                  respectively.
+        """
+        if depth == 'float' and os.path.splitext(filename)[1].lower() not in ['.tif', '.tiff']:
+            raise ValueError("Floating-point images can only be saved as TIFF.")
+
+        SyntheticImage._saveRaster(filename, self.getRaster(depth))
+
+    def getRaster(self, depth=8):
+        """
+        Returns the image pixels as saved by 'exportRaster', i.e.
+        an RGBA array (uint8) if 'depth' is 8, a uint16 array if
+        'depth' is 16 or a float32 array if 'depth' is 'float'.
+        """
+        if self.imageData is None:
+            raise ValueError("No image has been loaded, so there is no image to export.")
+
+        img, intmin, intmax = self._getImageData()
+        img = np.asarray(img)
+
+        mask = ~np.isfinite(img)
+        if self.maskLevel is not None:
+            mask |= img <= intmax*self.maskLevel
+
+        if depth == 'float':
+            # SOFT intensities are often far below the smallest 32-bit
+            # float, and would silently be saved as 0
+            amax = np.amax(np.abs(img), where=~mask, initial=0)
+            finfo = np.finfo(np.float32)
+            if amax > finfo.max or 0 < amax < finfo.tiny:
+                raise ValueError("The image intensities (max {0:g}) are outside the range of 32-bit floats. Use a logarithmic scale, or a bit depth of 8 or 16.".format(amax))
+
+            data = img.astype(np.float32)
+            data[mask] = np.nan
+            return data
+
+        # Normalize intensities to [0, 1]. This is done in double
+        # precision, since the intensities may be far below the
+        # range of 32-bit floats. Empty images (e.g. all zero) have
+        # no range of intensities, and are all set to 0.
+        t = np.subtract(img, intmin, dtype=np.float64)
+        if np.isfinite(intmin) and np.isfinite(intmax) and intmax > intmin:
+            np.divide(t, intmax-intmin, out=t)
+        else:
+            t[:] = 0
+        t[mask] = 0
+        t = t.astype(np.float32)
+
+        if depth == 16:
+            data = np.clip(t, 0, 1, out=t)
+            np.multiply(data, 65535, out=data)
+            data = data.astype(np.uint16)
+            data[mask] = 0
+            return data
+        elif depth == 8:
+            # Look up colors in the colormap, with extra entries for
+            # values under/over the color limits and masked values
+            cmap = colormaps.getColormap(self.colormapName)
+            N = cmap.N
+            lut = np.concatenate((cmap(np.arange(N), bytes=True), cmap(np.array([-1.0, 2.0, np.nan]), bytes=True)))
+
+            idx = np.clip(t*N, 0, N-1).astype(np.intp)
+            idx[t < 0] = N
+            idx[t > 1] = N+1
+            idx[mask] = N+2
+
+            return lut[idx]
+        else:
+            raise ValueError("Unrecognized bit depth: {0}. Must be 8, 16 or 'float'.".format(depth))
+
+    @staticmethod
+    def _saveRaster(filename, data):
+        from PIL import Image
+
+        # Fast PNG compression: the files are a bit larger,
+        # but are written several times faster
+        if os.path.splitext(filename)[1].lower() == '.png':
+            Image.fromarray(data).save(filename, compress_level=1)
+        else:
+            Image.fromarray(data).save(filename)
 
     def update(self):
-        self.canvas.draw()
+        self._setOverlaysAnimated(self.animatedOverlays)
+        with getSessionProfiler().stage('draw'):
+            self.canvas.draw()
 
     #####################################################
     #
@@ -326,12 +702,15 @@ class SyntheticImage:
         # Reset plot handles
         self._colorbar = None
         self._fluxOverlayHandles = []
+        self._image = None
+        self._overlayInput = None
         self._separatrixOverlayHandle = None
         self._topviewOverlayHandles = None
         self._topviewSeparatrixOverlayHandles = None
         self._topviewOCSHandle = None
-        self._wallOverlayHandle = None
+        self._wallCrossSectionOverlayHandle = None
 
+    @profiled('captions')
     def plotCaptions(self):
         for i in range(0, len(self.axes.texts)):
             self.axes.texts.remove(self.axes.texts[0])
@@ -343,6 +722,7 @@ class SyntheticImage:
 
             self.axes.text(X, Y, caption, color='white', fontsize=fontsize)
 
+    @profiled('colorbar')
     def plotColorbar(self):
         """
         Add a colorbar to the axes 'ax' of figure 'fig'.
@@ -352,20 +732,8 @@ class SyntheticImage:
         self.removeColorbar()
         self.colorbar = True
 
-        if self.colorbarRelative:
-            mx = self.imageIntensityMax * self._imageMax
-            self._colorbar = self.figure.colorbar(self._image, shrink=0.8, ticks=[0,mx*0.2,mx*0.4,mx*0.6,mx*0.8,mx])
-            self._colorbar.ax.set_yticklabels(['0%','20%','40%','60%','80%','100%'])
-        else:
-            mn = self._image.get_clim()[0]
-
-            if mn < 0:
-                mx = max(abs(mn), self._image.get_clim()[1])
-                dm = 2*mx
-                mn = -mx
-                self._colorbar = self.figure.colorbar(self._image, shrink=0.8, ticks=[mn, mn+dm*0.2, mn+dm*0.4, mn+dm*0.6, mn+dm*0.8, mx])
-            else:
-                self._colorbar = self.figure.colorbar(self._image, shrink=0.8)
+        self._colorbar = self.figure.colorbar(self._image, shrink=0.8)
+        self._setColorbarTicks()
         self._colorbar.ax.tick_params(labelcolor='white', color='white')
 
     def removeColorbar(self):
@@ -383,27 +751,28 @@ class SyntheticImage:
         the image are computed and applied.
         """
         # Get colormap
-        colormap = plt.get_cmap(self.colormapName)
+        colormap = colormaps.getColormap(self.colormapName)
 
-        # Get the image (linear or logarithmized)
-        imageData, intmin, intmax = self._getImageData()
-
-        # Apply mask if requested
-        zorder = 0
-        if self.maskLevel is not None:
-            imageData = np.ma.masked_where(imageData <= intmax*self.maskLevel, imageData)
-            zorder = 10     # Put on top of everything
+        # Get the image (linear or logarithmized, possibly masked)
+        imageData, intmin, intmax, zorder = self._getPlotData()
 
         # Compute image extent
-        extent = self._getImageExtent()
+        extent = self._displayExtent
 
         # Plot image
         #self._image = self.axes.imshow(imageData, origin='lower', cmap=colormap,
-        self._image = self.axes.imshow(imageData, cmap=colormap,
-                          interpolation=None, clim=(intmin, intmax),
-                          extent=extent, zorder=zorder)
+        with getSessionProfiler().stage('imshow'):
+            self._image = self.axes.imshow(imageData, cmap=colormap,
+                              interpolation=None, clim=(intmin, intmax),
+                              extent=extent, zorder=zorder)
+        self._plottedData = imageData
         self.axes.set_axis_off()
 
+        # Show the appropriate image pyramid level when zooming
+        self.axes.callbacks.connect('xlim_changed', self._viewChanged)
+        self.axes.callbacks.connect('ylim_changed', self._viewChanged)
+
+    @profiled('overlays')
     def plotOverlays(self):
         """
         Plot wall/equilibrium overlays as specified in
@@ -453,18 +822,19 @@ class SyntheticImage:
         self.removeFluxSurfaces()
         self._fluxOverlayHandles = []
 
+        camera = self.getCamera()
         R = self.flux['R']
         Z = self.flux['Z']
         lengths = self.flux['lengths']
         for i in range(0, len(lengths)):
             rz = np.transpose(np.array([R[i,:lengths[i]], Z[i,:lengths[i]]]))
-            h = plotOrthogonalCrossSection(self.axes, rz, self.detectorPosition, self.detectorDirection, linewidth=linewidth, plotstyle=plotstyle)
+            h = plotOrthogonalCrossSection(self.axes, rz, self.detectorPosition, self.detectorDirection, linewidth=linewidth, plotstyle=plotstyle, camera=camera)
             self._fluxOverlayHandles.append(h)
 
         self.overlayFluxSurfaces = True
 
     def removeFluxSurfaces(self):
-        if not self._fluxOverlayHandles:
+        if self._fluxOverlayHandles:
             for h in self._fluxOverlayHandles:
                 h.remove()
 
@@ -482,7 +852,7 @@ class SyntheticImage:
             raise ValueError("No wall data has been provided!")
 
         self.removeWallCrossSection()
-        self._wallCrossSectionOverlayHandle = plotOrthogonalCrossSection(self.axes, self.wall, self.detectorPosition, self.detectorDirection, linewidth=linewidth, plotstyle=plotstyle)
+        self._wallCrossSectionOverlayHandle = plotOrthogonalCrossSection(self.axes, self.wall, self.detectorPosition, self.detectorDirection, linewidth=linewidth, plotstyle=plotstyle, camera=self.getCamera())
         self.overlayWallCrossSection = True
 
     def removeWallCrossSection(self):
@@ -506,7 +876,7 @@ class SyntheticImage:
             raise ValueError("No separatrix data has been provided!")
 
         self.removeSeparatrix()
-        self._separatrixOverlayHandle = plotOrthogonalCrossSection(self.axes, self.separatrix, self.detectorPosition, self.detectorDirection, linewidth=linewidth, plotstyle=plotstyle)
+        self._separatrixOverlayHandle = plotOrthogonalCrossSection(self.axes, self.separatrix, self.detectorPosition, self.detectorDirection, linewidth=linewidth, plotstyle=plotstyle, camera=self.getCamera())
         self.overlaySeparatrix = True
 
     def removeSeparatrix(self):
@@ -525,13 +895,14 @@ class SyntheticImage:
         Also toggles the setting so that 'assembleImage' will
         automatically include the overlay.
         """
-        if wall is None:
+        isWall = wall is None
+        if isWall:
             if self.wall is None:
                 raise ValueError("No wall data has been specified, which is required for the topview")
             else:
                 wall = self.wall
 
-        self.removeTopview()
+            self.removeTopview()
         t = np.linspace(0, 2*np.pi)
         extent = self._getImageExtent()
 
@@ -544,7 +915,7 @@ class SyntheticImage:
         h1 = self.axes.plot(rmaj * np.cos(t), rmaj * np.sin(t), color, linewidth=linewidth)[0]
         h2 = self.axes.plot(rmin * np.cos(t), rmin * np.sin(t), color, linewidth=linewidth)[0]
 
-        if wall is None:
+        if isWall:
             self._topviewOverlayHandles = (h1, h2)
             self.overlayTopview = True
         else:
@@ -572,6 +943,7 @@ class SyntheticImage:
         if self.separatrix is None:
             raise ValueError("No separatrix data has been specified, which is required for the topview")
 
+        self.removeTopviewSeparatrix()
         (h1, h2) = self.plotTopview(wall=self.separatrix, color=color, linewidth=linewidth)
         self._topviewSeparatrixOverlayHandles = (h1, h2)
         self.overlayTopviewSeparatrix = True
@@ -603,14 +975,14 @@ class SyntheticImage:
         self.removeTopviewOrthogonalCrossSection()
 
         # Rotate points along with camera
-        cossin = [np.dot(self.detectorDirection, [0,1,0]), np.dot(self.detectorDirection, [1,0,0])]
-        cossin = cossin / np.sqrt(cossin[0]**2 + cossin[1]**2)  # Normalize
+        cossin = self.getCamera().cossin
 
         extent = self._getImageExtent()
         l1 = extent[1]
         l2 = extent[1] * (self.wall_rmin/self.wall_rmax)
 
-        self._topviewOCSHandle = self.axes.plot([l1*cossin[0], l2*cossin[0]], [-l1*cossin[1], -l2*cossin[1]], plotstyle, linewidth=linewidth)
+        self._topviewOCSHandle, = self.axes.plot([l1*cossin[0], l2*cossin[0]], [-l1*cossin[1], -l2*cossin[1]], plotstyle, linewidth=linewidth)
+        self.overlayTopviewOrthogonalCrossSection = True
 
     def removeTopviewOrthogonalCrossSection(self):
         """
@@ -621,21 +993,21 @@ class SyntheticImage:
             self._topviewOCSHandle.remove()
             self._topviewOCSHandle = None
 
-        self.overlayTopviewOrthogonalCrossSection = True
+        self.overlayTopviewOrthogonalCrossSection = False
 
     def plotWall(self, plotstyle='w', degreesStart=[0], degreesEnd=[360],
              spacing=1, linewidth=0.1, rlim=0, zuplim=0, zlowlim=0,
              rmin=-1, rmax=1, zmin=-1, zmax=1):
         plotwall(self.axes, self.wall, self.detectorPosition, self.detectorDirection,
              self.detectorRoll, plotstyle, degreesStart, degreesEnd, spacing, linewidth,
-             rlim, zuplim, zlowlim, rmin, rmax, zmin, zmax)
+             rlim, zuplim, zlowlim, rmin, rmax, zmin, zmax, camera=self.getCamera())
 
     def drawCircle(self, r, z, plotstyle='w', linewidth=1, degreeStart=180, degreeEnd=360):
         t = np.linspace(degreeStart * np.pi / 180, degreeEnd * np.pi / 180)
         xp = r * np.cos(t)
         yp = r * np.sin(t)
         zp = np.zeros(t.shape) + z
-        plotCrossSection(self.axes, xp, yp, zp, self.detectorPosition, self.detectorDirection, linewidth=linewidth, plotstyle=plotstyle)
+        plotCrossSection(self.axes, xp, yp, zp, self.detectorPosition, self.detectorDirection, linewidth=linewidth, plotstyle=plotstyle, camera=self.getCamera())
 
     #####################################################
     #
@@ -651,23 +1023,324 @@ class SyntheticImage:
         are returned,
         """
         img = self.imageData
+        if self.logarithmic:
+            img = self._getLogImage()
+
+        intmin, intmax = self._getColorLimits()
+        return img, intmin, intmax
+
+    def _getColorLimits(self):
+        """
+        Returns the color limits of the image (of the logarithmized
+        image if 'logarithmic' is set).
+        """
         intmax = self.imageIntensityMax * self._imageMax
-        intmin = np.amin(img)
+        intmin = self._getImageMin()
 
         if intmin < 0:
             intmax = max(abs(intmin), intmax)
             intmin = -intmax
 
         if self.logarithmic:
-            img = np.log10(img)
-            intmax = np.log10(intmax)
+            with np.errstate(divide='ignore'):
+                intmax = np.log10(intmax)
             intmin = intmax - 40
 
-            # Set all elements that are log10(0) = -inf or
-            # at least below the "zero" level to "zero"
-            img[np.where(img < intmin)] = intmin
+        return intmin, intmax
 
-        return img, intmin, intmax
+    def _setOverlaysAnimated(self, animated):
+        for h in self.getOverlayHandles():
+            h.set_animated(animated)
+
+    def _getImageMin(self):
+        """
+        Returns the minimum of the image data. The value is cached
+        until 'imageData' is replaced.
+        """
+        if self._imageMinSource is not self.imageData:
+            self._imageMin = np.amin(self.imageData)
+            self._imageMinSource = self.imageData
+
+        return self._imageMin
+
+    def _getLogImage(self, data=None):
+        """
+        Returns the logarithm of 'data' (default: the image data).
+        Elements that are log10(0) = -inf are set to a value far
+        below any "zero" level used in '_getColorLimits', so that
+        they are drawn in the lowest color of the colormap. The
+        logarithmized data is cached until other data is given.
+        """
+        if data is None:
+            data = self.imageData
+
+        if self._logImageSource is not data:
+            with getSessionProfiler().stage('log'):
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    img = np.log10(data)
+
+                np.copyto(img, LOG_ZERO_LEVEL, where=(img == -np.inf))
+
+            self._logImage = img
+            self._logImageSource = data
+
+        return self._logImage
+
+    def _getPlotLevel(self):
+        """
+        Returns the image pyramid level (or region of it) to show,
+        logarithmized if 'logarithmic' is set. The pyramid is built
+        from the linear image data, so that downsampling preserves
+        the intensity (and zero pixels don't dominate the average
+        of the logarithm).
+        """
+        level = self._getPyramidLevel(self.imageData)
+        if self.logarithmic:
+            level = self._getLogImage(level)
+
+        return level
+
+    def _getPlotData(self):
+        """
+        Returns the image data to plot (with the mask applied, if
+        requested), the color limits and the z-order of the image.
+        """
+        intmin, intmax = self._getColorLimits()
+
+        # Only show as many pixels as fit on the screen
+        imageData = self._getPlotLevel()
+        self._plottedLevel = imageData
+
+        # Apply mask if requested
+        zorder = 0
+        if self.maskLevel is not None:
+            imageData = np.ma.masked_where(imageData <= intmax*self.maskLevel, imageData)
+            zorder = 10     # Put on top of everything
+
+        return imageData, intmin, intmax, zorder
+
+    def _getPyramidLevel(self, imageData):
+        """
+        Returns the level of the image pyramid of 'imageData' which
+        best matches the current size and zoom of the axes. When
+        zoomed in, only the visible part of the level (with a margin
+        for panning) is returned. The extent of the returned data is
+        stored in '_displayExtent'. Small images are always shown in
+        full resolution.
+        """
+        self._pyramidLevel = 0
+        self._displayExtent = self._getDataExtent()
+
+        threshold = self.previewSize if self._preview else self.pyramidThreshold
+        if self._fullResolution or threshold is None or max(imageData.shape) <= threshold:
+            return imageData
+
+        pyramid = None
+        for source, p in self._pyramids:
+            if source is imageData and p.reduction == self.pyramidReduction:
+                pyramid = p
+                break
+
+        if pyramid is None:
+            pyramid = ImagePyramid(imageData, reduction=self.pyramidReduction)
+
+            # Keep pyramids of the two most recently shown images
+            self._pyramids = self._pyramids[-1:] + [(imageData, pyramid)]
+            self._pyramidView = None
+
+        if self._preview:
+            # Finest level which is small enough
+            self._pyramidLevel = len(pyramid)-1
+            for i in range(len(pyramid)):
+                if max(pyramid.getLevel(i).shape) <= self.previewSize:
+                    self._pyramidLevel = i
+                    break
+
+            return pyramid.getLevel(self._pyramidLevel)
+
+        visibleFraction, screenSize = self._getViewSize()
+        self._pyramidLevel = pyramid.selectLevel(visibleFraction, screenSize)
+        level = pyramid.getLevel(self._pyramidLevel)
+
+        if max(visibleFraction) >= 0.5:
+            return level
+
+        # Zoomed in: only show the visible region (with a margin of
+        # one view in each direction, so that panning is smooth)
+        rows, cols = self._getVisibleRegion(level.shape)
+        if self._pyramidView is not None:
+            lvl, vrows, vcols, view, extent = self._pyramidView
+            if lvl is level and vrows[0] <= rows[0] and rows[1] <= vrows[1] and vcols[0] <= cols[0] and cols[1] <= vcols[1]:
+                self._displayExtent = extent
+                return view
+
+        dr, dc = rows[1]-rows[0], cols[1]-cols[0]
+        rows = (max(rows[0]-dr, 0), min(rows[1]+dr, level.shape[0]))
+        cols = (max(cols[0]-dc, 0), min(cols[1]+dc, level.shape[1]))
+
+        e = self._displayExtent
+        ny, nx = level.shape
+        w, h = e[1]-e[0], e[3]-e[2]
+        extent = [e[0] + w*cols[0]/nx, e[0] + w*cols[1]/nx, e[3] - h*rows[1]/ny, e[3] - h*rows[0]/ny]
+        view = level[rows[0]:rows[1], cols[0]:cols[1]]
+
+        self._pyramidView = (level, rows, cols, view, extent)
+        self._displayExtent = extent
+
+        return view
+
+    def _getVisibleRegion(self, shape):
+        """
+        Returns the ranges of rows and columns of an image with the
+        given shape which are visible in the axes.
+        """
+        e = self._getDataExtent()
+        xlim, ylim = sorted(self.axes.get_xlim()), sorted(self.axes.get_ylim())
+        ny, nx = shape
+
+        # Row 0 is at the top of the image
+        c0 = int(np.floor((xlim[0]-e[0]) / (e[1]-e[0]) * nx))
+        c1 = int(np.ceil((xlim[1]-e[0]) / (e[1]-e[0]) * nx))
+        r0 = int(np.floor((e[3]-ylim[1]) / (e[3]-e[2]) * ny))
+        r1 = int(np.ceil((e[3]-ylim[0]) / (e[3]-e[2]) * ny))
+
+        return (max(r0, 0), min(r1, ny)), (max(c0, 0), min(c1, nx))
+
+    def _getViewSize(self):
+        """
+        Returns the fraction of the image (height, width) which is
+        visible in the axes, as well as the size of the axes in
+        screen pixels (height, width).
+        """
+        if self.axes is None:
+            return (1, 1), (self.figure.bbox.height, self.figure.bbox.width)
+
+        bbox = self.axes.get_window_extent()
+        extent = self._getDataExtent()
+        xlim, ylim = self.axes.get_xlim(), self.axes.get_ylim()
+
+        fx = min(abs(xlim[1]-xlim[0]) / (extent[1]-extent[0]), 1)
+        fy = min(abs(ylim[1]-ylim[0]) / (extent[3]-extent[2]), 1)
+
+        return (fy, fx), (bbox.height, bbox.width)
+
+    def _viewChanged(self, *args):
+        """
+        Called when the axes are zoomed, panned or resized. Switches
+        to the appropriate level (and region) of the image pyramid.
+        """
+        if self._updatePyramidLevel():
+            self.canvas.draw_idle()
+
+    def _updatePyramidLevel(self):
+        """
+        Show the image pyramid level (and region) which matches the
+        current view. Returns True if the data shown changed.
+        """
+        if self._image is None or self.imageData is None:
+            return False
+
+        # Compare before masking, since the mask is a new array every time
+        if self._getPlotLevel() is self._plottedLevel:
+            return False
+
+        imageData, _, _, _ = self._getPlotData()
+
+        if imageData is not self._plottedData:
+            self._image.set_data(imageData)
+            self._plottedData = imageData
+            self._setDisplayExtent()
+            return True
+        else:
+            return False
+
+    def _setDisplayExtent(self):
+        """
+        Set the extent of the image handle to that of the data
+        currently shown. When only a region of the image is shown,
+        the axis limits are left untouched.
+        """
+        if self._pyramidView is not None and self._displayExtent is self._pyramidView[4]:
+            autoscale = self.axes.get_autoscale_on()
+            self.axes.set_autoscale_on(False)
+            self._image.set_extent(self._displayExtent)
+            self.axes.set_autoscale_on(autoscale)
+        else:
+            self._image.set_extent(self._displayExtent)
+
+    def _getOverlayInput(self):
+        """
+        Returns the data which the overlays depend on, used for
+        deciding whether overlays must be re-plotted.
+        """
+        return (self.detectorPosition, self.detectorDirection, self.detectorVisang,
+                self.detectorRoll, self.wall, self.separatrix, self.flux)
+
+    def _isSameOverlayInput(self, a, b):
+        if a is None or b is None:
+            return a is b
+
+        for x, y in zip(a, b):
+            if x is y:
+                continue
+            elif x is None or y is None or type(x) != type(y):
+                return False
+            elif isinstance(x, dict):
+                if x.keys() != y.keys() or not all([np.array_equal(x[k], y[k]) for k in x]):
+                    return False
+            elif not np.array_equal(x, y):
+                return False
+
+        return True
+
+    def _setColorbarTicks(self):
+        """
+        Set the ticks of the colorbar. Uses percentage ticks if
+        'colorbarRelative' is True.
+        """
+        if self.colorbarRelative:
+            mx = self.imageIntensityMax * self._imageMax
+            self._colorbar.set_ticks([0,mx*0.2,mx*0.4,mx*0.6,mx*0.8,mx])
+            self._colorbar.ax.set_yticklabels(['0%','20%','40%','60%','80%','100%'])
+        else:
+            mn = self._image.get_clim()[0]
+
+            if mn < 0:
+                mx = max(abs(mn), self._image.get_clim()[1])
+                dm = 2*mx
+                mn = -mx
+                self._colorbar.set_ticks([mn, mn+dm*0.2, mn+dm*0.4, mn+dm*0.6, mn+dm*0.8, mx])
+
+    @staticmethod
+    def _getGeometry(data):
+        """
+        Returns the detector setup read into 'data', as keyword
+        arguments for 'Stokes'.
+        """
+        return {name: data[name] for name in GEOMETRY if name in data}
+
+    @staticmethod
+    def _sliceImage(data, image, region=None, stride=None):
+        """
+        Returns the given region of interest (with the given stride)
+        of a fully loaded image, and records in the dict 'data' which
+        part of the full image is shown.
+        """
+        data['_imageShape'] = np.shape(image)
+        data['_imageSlices'] = imageSlices(data['_imageShape'], region, stride)
+
+        if data['_imageSlices'] is None:
+            return image
+        else:
+            return image[data['_imageSlices']]
+
+    def _getDataExtent(self):
+        """
+        Compute the extent of the loaded image data. This is the
+        same as the extent of the image, unless only a region of the
+        image (or only every n'th pixel) was loaded.
+        """
+        return sliceExtent(self._getImageExtent(), self._imageShape, self._imageSlices)
 
     def _getImageExtent(self):
         """
@@ -689,134 +1362,106 @@ class SyntheticImage:
 #########################################################
 def _limitwall(rc, zc, rlim, zuplim, zlowlim):
     """ Sort out the segments that are within radial
-        bound 'rlim' and z interval [zlowlim, zuplim] """
-    nrc, nzc = np.array([]), np.array([])
-    for i in range(len(rc)):
-        if rlim <= 0 or rc[i] < rlim:
-            if zuplim != 0 and zc[i] > zuplim:
-                nrc = np.append(nrc, np.nan)
-                nzc = np.append(nzc, np.nan)
-                continue
-            if zlowlim != 0 and zc[i] < zlowlim:
-                nrc = np.append(nrc, np.nan)
-                nzc = np.append(nzc, np.nan)
-                continue
-
-            nrc = np.append(nrc, rc[i])
-            nzc = np.append(nzc, zc[i])
-
-    return nrc, nzc
-
-def _rotateWall(rc, zc, angle=0, cossin=[]):
-    """ Rotate wall section around the symmetry axis """
-    nrc, nyc, nzc = rc, rc, zc
-    if len(cossin) == 2:
-        nrc = rc * cossin[0]
-        nyc =-rc * cossin[1]
-        nzc = zc
-    else:
-        radAngle = angle * np.pi / 180
-        nrc = rc * np.cos(radAngle)
-        nyc =-rc * np.sin(radAngle)
-        nzc = zc
-
-    return nrc, nyc, nzc
-
-
-def _rotateAboutAxis(xc, yc, zc, axis, angle=0):
-    dx = axis[0]
-    dy = axis[1]
-    dz = axis[2]
-
-    cs = np.cos(-angle)
-    sn = np.sin(-angle)
-
-    R = np.array([
-        [cs+dx**2*(1-cs),    dx*dy*(1-cs)-dz*sn, dx*dz*(1-cs)+dy*sn],
-        [dy*dx*(1-cs)+dz*sn, cs+dy**2*(1-cs),    dy*dz*(1-cs)-dx*sn],
-        [dz*dx*(1-cs)-dy*sn, dz*dy*(1-cs)+dx*sn, cs+dz**2*(1-cs)]
-    ])
-
-    V = np.array([xc, yc, zc])
-    X = np.matmul(R, V)
-
-    return X[0,:], X[1,:], X[2,:]
-    
+        bound 'rlim' and z interval [zlowlim, zuplim]. Points
+        outside the z interval are replaced by NaN, so that the
+        wall is broken there when plotted. """
+    rc, zc = np.asarray(rc, dtype=float), np.asarray(zc, dtype=float)
 
-def _transformWall(rc, yc, zc, cameraPosition, cameraDirection):
-    """ Transform wall section (rotate and translate) so that
-        it matches the camera setup """
-    # [1] COMPUTE ROTATION MATRIX
-    y = [0,1,0]
-    v = np.cross(cameraDirection, y)
-    c = np.dot(cameraDirection, y)
+    if rlim > 0:
+        inside = rc < rlim
+        rc, zc = rc[inside], zc[inside]
 
-    vmat = [[0,-v[2],v[1]], [v[2],0,-v[0]], [-v[1],v[0],0]]
-    R = np.add(np.identity(3), vmat)
-    vmat2 = np.dot(vmat, vmat) * 1 / (1+c)
-    R = np.add(R, vmat2)
+    cut = np.zeros(rc.shape, dtype=bool)
+    if zuplim != 0: cut |= zc > zuplim
+    if zlowlim != 0: cut |= zc < zlowlim
 
-    nrc = np.subtract(rc, cameraPosition[0])
-    nyc = np.subtract(yc, cameraPosition[1])
-    nzc = np.subtract(zc, cameraPosition[2])
+    return np.where(cut, np.nan, rc), np.where(cut, np.nan, zc)
 
-    wallVector = np.dot(R, [nrc,nyc,nzc])
-
-    return wallVector[0,:], wallVector[1,:], wallVector[2,:]
-
-def plotOrthogonalCrossSection(ax, wall, cameraPosition, cameraDirection, plotstyle='w', linewidth=0.1):
+def plotOrthogonalCrossSection(ax, wall, cameraPosition, cameraDirection, plotstyle='w', linewidth=0.1, camera=None):
     """ Plot the wall cross section that us orthogonal to the camera's viewing direction """
-    rc = wall[:,0]
-    zc = wall[:,1]
+    if camera is None:
+        camera = Camera(cameraPosition, cameraDirection)
 
-    cossin = [np.dot(cameraDirection, [0,1,0]), np.dot(cameraDirection, [1,0,0])]
-    cossin = cossin / np.sqrt(cossin[0]**2 + cossin[1]**2)      # Normalize
-    nrc, nyc, nzc = _rotateWall(rc, zc, cossin=cossin)
-    return plotCrossSection(ax, nrc, nyc, nzc, cameraPosition, cameraDirection, plotstyle, linewidth)
+    points = camera.orthogonalCrossSection(wall[:,0], wall[:,1])
+    return _plotProjection(ax, camera.project(points), plotstyle, linewidth)
 
 def plotwall(ax, wall, cameraPosition, cameraDirection, cameraRoll=0, plotstyle='w',
              degreesStart=[0], degreesEnd=[360], spacing=1, linewidth=0.1,
-             rlim=0, zuplim=0, zlowlim=0, rmin=-1, rmax=1, zmin=-1, zmax=1):
+             rlim=0, zuplim=0, zlowlim=0, rmin=-1, rmax=1, zmin=-1, zmax=1, camera=None):
     """ Plot the wall. Allows setting limits on which parts to plot, and
-        plot several parts of the wall simultaneously. """
+        plot several parts of the wall simultaneously. All toroidal
+        sections are projected in one go and plotted as a single
+        LineCollection, which is returned. Plot styles with markers
+        (e.g. 'wo') can't be drawn as a LineCollection, so then each
+        section is plotted separately, and a list of the Line2D
+        handles is returned instead. """
+    if camera is None:
+        camera = Camera(cameraPosition, cameraDirection, cameraRoll)
+
     rc = wall[:,0]
     zc = wall[:,1]
 
     # Limit the wall to only inner parts
     rc, zc = _limitwall(rc, zc, rlim, zuplim, zlowlim)
 
-    handles = []
+    degrees = []
     for i in range(len(degreesStart)):
-        for degree in range(degreesStart[i], degreesEnd[i], spacing):
-            # [1] ROTATE WALL SECTION AROUND ORIGO
-            nrc, nyc, nzc = _rotateWall(rc, zc, angle=degree)
+        degrees += list(range(degreesStart[i], degreesEnd[i], spacing))
+
+    segments = projectWall(rc, zc, degrees, camera)
+
+    color, linestyle, marker = _parsePlotstyle(plotstyle)
+    if marker is not None:
+        return [ax.plot(s[:,0], s[:,1], plotstyle, linewidth=linewidth)[0] for s in segments]
+
+    lc = LineCollection(segments, colors=color, linestyles=linestyle, linewidths=linewidth)
+    ax.add_collection(lc)
+    ax.autoscale_view()
 
-            # [2] INTRODUCE CAMERA ROLL
-            if cameraRoll != 0:
-                nrc, nyc, nzc = _rotateAboutAxis(nrc, nyc, nzc, cameraDirection, angle=cameraRoll)
+    return lc
 
-            # [2] ROTATE, TRANSLATE AND PLOT WALL SECTION AROUND CAMERA
-            h = plotCrossSection(ax, nrc, nyc, nzc, cameraPosition, cameraDirection, plotstyle, linewidth)
-            handles.append(h)
+def projectWall(rc, zc, degrees, camera):
+    """ Rotate the wall cross section (rc, zc) to each of the given
+        toroidal angles (in degrees) and project all of them onto the
+        camera plane at once (including camera roll). Returns an array
+        of shape (len(degrees), len(rc), 2) with the projected points. """
+    angles = np.asarray(degrees, dtype=float) * np.pi / 180
+    rc, zc = np.asarray(rc, dtype=float), np.asarray(zc, dtype=float)
 
-    return handles
+    # [1] ROTATE WALL SECTIONS AROUND ORIGO
+    points = np.empty((len(angles), len(rc), 3))
+    points[:,:,0] = np.outer(np.cos(angles), rc)
+    points[:,:,1] =-np.outer(np.sin(angles), rc)
+    points[:,:,2] = zc
 
-def plotCrossSection(ax, rc, yc, zc, cameraPosition, cameraDirection, plotstyle='w', linewidth=0.1):
+    # [2] ROLL, ROTATE, TRANSLATE AND PROJECT ONTO CAMERA PLANE
+    return camera.project(points, roll=True)
+
+def _parsePlotstyle(plotstyle):
+    """ Convert a matplotlib format string (such as 'w', 'r--' or 'wo')
+        to a color, a line style and a marker (None if the string has
+        no marker), parsed the same way as by 'ax.plot'. """
+    from matplotlib.axes._base import _process_plot_format
+    linestyle, marker, color = _process_plot_format(plotstyle)
+
+    if marker in [None, 'None', '']:
+        marker = None
+    if linestyle is None:
+        linestyle = 'solid'
+
+    return matplotlib.colors.to_rgba(color if color is not None else 'w'), linestyle, marker
+
+def plotCrossSection(ax, rc, yc, zc, cameraPosition, cameraDirection, plotstyle='w', linewidth=0.1, camera=None):
     """ Plot a wall cross-section (that is rotated to some toroidal angle in the
         tokamak coordinate system before this function is called) """
-    n = len(rc)
+    if camera is None:
+        camera = Camera(cameraPosition, cameraDirection)
 
-    # Rotate and translate wall section
-    nrc, nyc, nzc = _transformWall(rc, yc, zc, cameraPosition, cameraDirection)
-    wallVector = [nrc, nzc, nyc, np.ones((1,n))[0]]
+    points = np.column_stack((rc, yc, zc))
+    return _plotProjection(ax, camera.project(points), plotstyle, linewidth)
 
-    # Apply camera matrix
-    cameraMatrix = np.array([[1,0,0,0],[0,1,0,0],[0,0,1,0]])
-    projectedVector = np.dot(cameraMatrix, wallVector)
-    factor = np.divide(1, wallVector[2])
-    factorMatrix = np.array([factor,factor,factor])
-    projectedVector = factorMatrix * projectedVector
-
-    h, = ax.plot(projectedVector[0,:], projectedVector[1,:], plotstyle, linewidth=linewidth)
+def _plotProjection(ax, projected, plotstyle='w', linewidth=0.1):
+    """ Plot an Nx2 array of points projected onto the camera plane """
+    h, = ax.plot(projected[:,0], projected[:,1], plotstyle, linewidth=linewidth)
     return h
-    
+
@@ -1,15 +1,9 @@
 from PyQt5 import QtWidgets
 from ui import vessel_design
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-import matplotlib
 
 from PyQt5.QtWidgets import QTableWidgetItem, QHeaderView, QMessageBox
 from PyQt5.QtCore import pyqtSignal
 
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from matplotlib.figure import Figure
 
 
 class Vessel(QtWidgets.QDialog):
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+#
+# Headless batch renderer for SOFT images.
+#
+# Renders any number of SOFT output files to image files
+# using the same settings for all, in parallel. In difference
+# to the main softviz program, this does not require Qt.
+#
+# Example:
+#   ./batch.py --colormap GeriMap --log --separatrix -o out/ scan/*.h5
+#
+##################################
+
+import matplotlib
+matplotlib.use('Agg')
+
+import argparse
+import glob
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from PolarizedImage import ImageType
+from SyntheticImage import SyntheticImage
+
+
+def render(filename, settings):
+    """
+    Render a single SOFT output file using the given settings
+    (a dict with the same keys as the command-line options).
+    Returns a tuple (filename, outfile, time, error), where
+    'error' is None if the image was rendered successfully.
+    """
+    outfile = None
+    tstart = time.perf_counter()
+    try:
+        # Keep the original extension in the name, since the same
+        # output is often stored in several formats
+        outfile = os.path.join(settings['outdir'], os.path.basename(filename)+'.'+settings['format'])
+
+        figure = Figure(facecolor='black')
+        canvas = FigureCanvasAgg(figure)
+        si = SyntheticImage(figure, canvas)
+
+        si.loadImageFile(filename, ImageType(settings['imagetype']), lazy=True, cache=settings['cache'])
+
+        si.setColormap(settings['colormap'])
+        si.toggleLogarithmic(settings['log'])
+        si.toggleColorbar(settings['colorbar'])
+        si.setCaptions(settings['captions'])
+        si.imageIntensityMax = settings['intensity']
+
+        si.overlaySeparatrix = settings['separatrix'] and si.hasSeparatrix()
+        si.overlayTopview = settings['topview'] and si.hasTopview()
+        si.overlayWallCrossSection = settings['wallcross'] and si.hasWall()
+
+        if settings['raster'] is None:
+            si.assembleImage()
+            si.savePlot(outfile)
+        else:
+            si.exportRaster(outfile, depth=settings['raster'])
+    except Exception as e:
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        return (filename, outfile, time.perf_counter()-tstart, error)
+
+    return (filename, outfile, time.perf_counter()-tstart, None)
+
+
+def renderAll(filenames, settings, jobs=None):
+    """
+    Render all the given files in parallel, using (at most)
+    'jobs' processes. Yields the result of 'render()' for
+    each file as soon as it is done.
+    """
+    os.makedirs(settings['outdir'], exist_ok=True)
+
+    if jobs == 1:
+        for f in filenames:
+            yield render(f, settings)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(render, f, settings) for f in filenames]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def expandFilenames(patterns):
+    """
+    Expand any glob patterns in the list of filenames (for
+    shells, or scripts, which do not do it themselves).
+    """
+    filenames = []
+    for p in patterns:
+        matches = sorted(glob.glob(p))
+        if matches:
+            filenames += matches
+        else:
+            filenames.append(p)
+
+    return filenames
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Render SOFT images without a GUI.')
+
+    parser.add_argument('files', nargs='+', help='SOFT output files (or glob patterns) to render.')
+    parser.add_argument('-o', '--outdir', default='.', help='Directory in which to store the rendered images.')
+    parser.add_argument('-f', '--format', default='png', help='Format of the rendered images (file extension).')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of processes to render with (default: number of CPUs).')
+    parser.add_argument('--colormap', default='GeriMap', help='Name of colormap to use.')
+    parser.add_argument('--log', action='store_true', help='Use a logarithmic intensity scale.')
+    parser.add_argument('--intensity', type=float, default=1, help='Colormap ceiling, relative to the maximum of each image.')
+    parser.add_argument('--imagetype', default=ImageType.I.value, choices=[t.value for t in ImageType if t != ImageType.EMPTY], help='Polarization quantity to show (polarized images only).')
+    parser.add_argument('--colorbar', action='store_true', help='Add a colorbar.')
+    parser.add_argument('--separatrix', action='store_true', help='Add separatrix overlay (if available).')
+    parser.add_argument('--topview', action='store_true', help='Add topview overlay (if available).')
+    parser.add_argument('--wallcross', action='store_true', help='Add wall cross-section overlay (if available).')
+    parser.add_argument('--caption', nargs=4, action='append', default=[], metavar=('X', 'Y', 'FONTSIZE', 'TEXT'), help='Add a caption. May be given several times.')
+    parser.add_argument('--cache', action='store_true', help='Cache legacy text images in a binary format.')
+    parser.add_argument('--raster', nargs='?', const='8', default=None, choices=['8', '16', 'float'], help='Only save the image pixels, at native resolution, with the given bit depth (default: 8). Much faster, but without overlays, captions and colorbar.')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArguments(argv)
+    settings = vars(args).copy()
+    settings['captions'] = settings.pop('caption')
+    if settings['raster'] in ['8', '16']:
+        settings['raster'] = int(settings['raster'])
+
+    filenames = expandFilenames(args.files)
+
+    nfailed = 0
+    tstart = time.perf_counter()
+    for filename, outfile, t, error in renderAll(filenames, settings, jobs=args.jobs):
+        if error is None:
+            print('{0:8.2f} s  {1} -> {2}'.format(t, filename, outfile))
+        else:
+            nfailed += 1
+            print('  FAILED    {0}: {1}'.format(filename, error), file=sys.stderr)
+
+    print('Rendered {0} of {1} images in {2:.2f} s.'.format(len(filenames)-nfailed, len(filenames), time.perf_counter()-tstart))
+
+    return 1 if nfailed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Benchmark of the wall limiting routines ('_limitwall' in
+# SyntheticImage and 'limitwall' in plotwall), comparing them
+# to the original loop-based implementations for walls of
+# increasing resolution.
+#
+# Usage:
+#   ./limitwall.py [NPOINTS ...]
+#
+##################################
+
+import numpy as np
+import os.path
+import sys
+import timeit
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import plotwall
+import SyntheticImage
+
+
+def loopLimitwallNaN(rc, zc, rlim, zuplim, zlowlim):
+    """ Original implementation of 'SyntheticImage._limitwall' """
+    nrc, nzc = np.array([]), np.array([])
+    for i in range(len(rc)):
+        if rlim <= 0 or rc[i] < rlim:
+            if zuplim != 0 and zc[i] > zuplim:
+                nrc = np.append(nrc, np.nan)
+                nzc = np.append(nzc, np.nan)
+                continue
+            if zlowlim != 0 and zc[i] < zlowlim:
+                nrc = np.append(nrc, np.nan)
+                nzc = np.append(nzc, np.nan)
+                continue
+
+            nrc = np.append(nrc, rc[i])
+            nzc = np.append(nzc, zc[i])
+
+    return nrc, nzc
+
+
+def loopLimitwall(rc, zc, rlim, zuplim, zlowlim):
+    """ Original implementation of 'plotwall.limitwall' """
+    nrc, nzc = np.array([]), np.array([])
+    for i in range(len(rc)):
+        if rlim <= 0 or rc[i] < rlim:
+            if zuplim != 0 and zc[i] > zuplim: continue
+            if zlowlim != 0 and zc[i] < zlowlim: continue
+
+            nrc = np.append(nrc, rc[i])
+            nzc = np.append(nzc, zc[i])
+
+    return nrc, nzc
+
+
+def generateWall(n):
+    """ Generate a D-shaped wall with 'n' points """
+    t = np.linspace(0, 2*np.pi, n)
+    return 1.7 + 0.6*np.cos(t + 0.4*np.sin(t)), 1.1*np.sin(t)
+
+
+def bench(f, args, number):
+    return min(timeit.repeat(lambda: f(*args), number=number, repeat=3)) / number
+
+
+def main(sizes):
+    limits = (2.1, 0.8, -0.9)
+
+    print('{0:>8s}  {1:>12s} {2:>12s} {3:>9s}   {4:>12s} {5:>12s} {6:>9s}'.format(
+        'points', '_limitwall', 'loop', 'speedup', 'limitwall', 'loop', 'speedup'))
+
+    for n in sizes:
+        rc, zc = generateWall(n)
+        args = (rc, zc) + limits
+
+        # Check that results are identical
+        np.testing.assert_array_equal(SyntheticImage._limitwall(*args), loopLimitwallNaN(*args))
+        np.testing.assert_array_equal(plotwall.limitwall(*args), loopLimitwall(*args))
+
+        number = max(1, 10000 // n)
+        t1, t1l = bench(SyntheticImage._limitwall, args, 100), bench(loopLimitwallNaN, args, number)
+        t2, t2l = bench(plotwall.limitwall, args, 100), bench(loopLimitwall, args, number)
+
+        print('{0:8d}  {1:10.3f}ms {2:10.3f}ms {3:8.0f}x   {4:10.3f}ms {5:10.3f}ms {6:8.0f}x'.format(
+            n, t1*1e3, t1l*1e3, t1l/t1, t2*1e3, t2l*1e3, t2l/t2))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sizes = [int(s) for s in sys.argv[1:]]
+    else:
+        sizes = [100, 1000, 10000, 50000]
+
+    main(sizes)
+
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+#
+# End-to-end benchmark of loading and rendering SOFT images.
+#
+# Synthetic SOFT outputs (plain images and Stokes parameters)
+# are generated at several sizes in each of the supported file
+# formats, and the time and peak memory of each step from
+# loading the file to saving the plot are measured, without a
+# GUI. The results are written as JSON and may be compared to
+# the results of an earlier run, to find performance regressions.
+#
+# Usage:
+#   ./suite.py [--sizes N ...] [-o results.json]
+#   ./suite.py --baseline baseline.json
+#
+# To create (or update) a baseline, save the results of a run
+# on the same machine:
+#   ./suite.py -o baseline.json
+#
+##################################
+
+import matplotlib
+matplotlib.use('Agg')
+
+import argparse
+import datetime
+import h5py
+import json
+import numpy as np
+import os
+import platform
+import resource
+import scipy.io
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from PolarizedImage import ImageType, PolarizedImage
+from SyntheticImage import SyntheticImage
+import thumbnails
+
+
+# Image sizes (pixels along each side) benchmarked by default.
+# Larger images (up to 8192) may be given with '--sizes', but
+# note that 8192x8192 Stokes parameters take 2 GB per copy.
+SIZES = [256, 1024, 4096]
+# File formats: legacy Matlab, HDF5-based Matlab (v7.3) and HDF5
+FORMATS = ['mat', 'mat73', 'h5']
+# Plain intensity images, and polarized images (Stokes parameters)
+VARIANTS = ['image', 'stokes']
+# Polarization quantities computed from the Stokes parameters
+QUANTITIES = [ImageType.I, ImageType.LINPOLFRAC, ImageType.POLANGLE]
+# Overlays plotted on top of the image
+OVERLAYS = ['plotWallCrossSection', 'plotSeparatrix', 'plotTopview', 'plotTopviewSeparatrix', 'plotTopviewOrthogonalCrossSection']
+
+# Example output providing a realistic wall, separatrix and camera
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'image.mat')
+
+
+def loadSetup():
+    """
+    Load the wall, separatrix and camera setup of the example
+    image. Returns a dict with the arrays as stored in SOFT
+    outputs (HDF5 layout).
+    """
+    with h5py.File(EXAMPLE, 'r') as f:
+        return {name: f[name][()] for name in ['wall', 'separatrix', 'detectorPosition', 'detectorDirection', 'detectorVisang']}
+
+
+def generateImage(n):
+    """
+    Generate an n-by-n synthetic image, resembling the crescent
+    shaped radiation spot seen by a camera in a tokamak.
+    """
+    y, x = np.ogrid[-1:1:n*1j, -1:1:n*1j]
+    r = np.hypot(x + 0.2, y / 1.3)
+    image = np.exp(-((r - 0.55) / 0.12)**2) * (1 + 0.6*x) * np.exp(-(y / 0.8)**4)
+    image += 1e-3 * np.random.default_rng(n).random((n, n))
+
+    return image
+
+
+def generateStokes(image):
+    """
+    Generate Stokes parameters for the given intensity image,
+    with a polarization angle varying around the image centre.
+    """
+    n = image.shape[0]
+    y, x = np.ogrid[-1:1:n*1j, -1:1:n*1j]
+    angle = 2 * np.arctan2(y, x)
+
+    yield 'I', image
+    yield 'Q', 0.4 * image * np.cos(angle)
+    yield 'U', 0.4 * image * np.sin(angle)
+    yield 'V', 0.05 * image * y
+
+
+def datasetName(directory, size, fmt, variant):
+    """
+    Returns the name of the file containing the given dataset.
+    """
+    if fmt == 'mat73':
+        return os.path.join(directory, '{0}-{1}-v73.mat'.format(variant, size))
+    else:
+        return os.path.join(directory, '{0}-{1}.{2}'.format(variant, size, fmt))
+
+
+def generateDataset(filename, size, fmt, variant, setup):
+    """
+    Write a synthetic SOFT output to the named file. Images are
+    stored transposed, as they are by SOFT.
+    """
+    image = generateImage(size)
+    if variant == 'image':
+        arrays = {'image': image}
+    else:
+        arrays = {'Stokes'+c: s for c, s in generateStokes(image)}
+
+    if fmt == 'mat':
+        data = {name: np.transpose(arr) for name, arr in arrays.items()}
+        data['wall'] = setup['wall']
+        data['separatrix'] = setup['separatrix']
+        data['detectorPosition'] = setup['detectorPosition'].reshape((1,3))
+        data['detectorDirection'] = setup['detectorDirection'].reshape((1,3))
+        data['detectorVisang'] = setup['detectorVisang'].reshape((1,1))
+        scipy.io.savemat(filename, data)
+    else:
+        # Matlab v7.3 files are HDF5 files with a 512 byte header
+        userblock = 512 if fmt == 'mat73' else 0
+        with h5py.File(filename, 'w', userblock_size=userblock) as f:
+            for name, arr in arrays.items():
+                f[name] = np.transpose(arr)
+            for name, arr in setup.items():
+                f[name] = arr
+
+        if fmt == 'mat73':
+            # Text, subsystem offset, version 0x0200 and endian indicator
+            header = b'MATLAB 7.3 MAT-file, created by softviz benchmarks'.ljust(116) + bytes(8) + b'\x00\x02IM'
+            with open(filename, 'r+b') as f:
+                f.write(header)
+
+
+def generateDatasets(directory, sizes, formats, variants):
+    """
+    Generate all datasets which do not already exist in the
+    given directory. Yields (size, format, variant, filename)
+    for every dataset.
+    """
+    setup = loadSetup()
+    for size in sizes:
+        for fmt in formats:
+            for variant in variants:
+                filename = datasetName(directory, size, fmt, variant)
+                if not os.path.isfile(filename):
+                    print('Generating {0}...'.format(filename), flush=True)
+                    generateDataset(filename, size, fmt, variant, setup)
+
+                yield size, fmt, variant, filename
+
+
+def checkExample():
+    """
+    Check that the example output is not exported (or shown as
+    a thumbnail) as a blank image. Its intensities (~1e-72) are
+    far below the range of 32-bit floats, which has made exports
+    silently all black.
+    Returns a list of the problems found.
+    """
+    si = SyntheticImage(Figure(), None)
+    si.loadImageFile(EXAMPLE)
+
+    problems = []
+    if len(np.unique(si.getRaster(8).reshape((-1, 4)), axis=0)) < 2:
+        problems.append('8-bit raster of the example output is blank')
+    if np.amax(si.getRaster(16)) == 0:
+        problems.append('16-bit raster of the example output is blank')
+
+    thumbnail = thumbnails.renderThumbnail(EXAMPLE)
+    if len(np.unique(thumbnail.reshape((-1, thumbnail.shape[-1])), axis=0)) < 2:
+        problems.append('thumbnail of the example output is blank')
+
+    return problems
+
+
+def runCase(filename, variant, outdir, measure):
+    """
+    Run all steps of loading and rendering the given file.
+    Each step is run through 'measure(step, f)', which should
+    call 'f()' and return its return value.
+    """
+    figure = Figure(facecolor='black')
+    canvas = FigureCanvasAgg(figure)
+    si = SyntheticImage(figure, canvas)
+
+    measure('loadImageFile', lambda : si.loadImageFile(filename))
+
+    if variant == 'stokes':
+        for imgtype in QUANTITIES:
+            measure('getPolarizationQuantity[{0}]'.format(imgtype.name),
+                    lambda : PolarizedImage.getPolarizationQuantity(imgtype, si.stokes))
+
+        pi = PolarizedImage(Figure(), None)
+        measure('loadPolarizedImage', lambda : pi.loadPolarizedImage(filename))
+
+    measure('assembleImage', si.assembleImage)
+    measure('draw', canvas.draw)
+
+    for overlay in OVERLAYS:
+        measure(overlay, getattr(si, overlay))
+
+    # Includes the redraw, which is what makes the slider slow
+    def changeIntensity():
+        si.changeIntensity(0.5, relative=True)
+        canvas.draw()
+
+    measure('changeIntensity', changeIntensity)
+    measure('savePlot', lambda : si.savePlot(os.path.join(outdir, 'plot.png')))
+
+    si.closeFile()
+
+
+def timeCase(filename, variant, outdir, repeat):
+    """
+    Time each step of the given case, returning the shortest
+    time (in seconds) of 'repeat' runs for each step.
+    """
+    times = {}
+    def measure(step, f):
+        tstart = time.perf_counter()
+        result = f()
+        t = time.perf_counter() - tstart
+        times[step] = min(t, times.get(step, t))
+        return result
+
+    for i in range(repeat):
+        runCase(filename, variant, outdir, measure)
+
+    return times
+
+
+def memoryCase(filename, variant, outdir):
+    """
+    Measure the peak memory allocated (in bytes, on top of what
+    was already allocated) during each step of the given case.
+    Run separately from 'timeCase()', since tracing allocations
+    slows down the program considerably.
+    """
+    peaks = {}
+    def measure(step, f):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = f()
+        peaks[step] = tracemalloc.get_traced_memory()[1] - before
+        return result
+
+    tracemalloc.start()
+    try:
+        runCase(filename, variant, outdir, measure)
+    finally:
+        tracemalloc.stop()
+
+    return peaks
+
+
+def compare(results, baseline, tolerance, mintime, minmemory=2**20):
+    """
+    Compare results to a baseline. Returns a list of regressions
+    (case, step, quantity, value, baseline value), i.e. all times
+    and peak memories which exceed the baseline by more than the
+    given relative tolerance. Times shorter than 'mintime' and
+    memory below 'minmemory' are ignored, since they are too noisy
+    to compare.
+    """
+    minimum = {'time': mintime, 'peakMemory': minmemory}
+
+    regressions = []
+    for case, steps in results['results'].items():
+        for step, values in steps.items():
+            try: old = baseline['results'][case][step]
+            except KeyError: continue
+
+            for quantity in ['time', 'peakMemory']:
+                new, ref = values.get(quantity), old.get(quantity)
+                if new is None or ref is None:
+                    continue
+                if max(new, ref) < minimum[quantity]:
+                    continue
+
+                if new > ref * (1 + tolerance):
+                    regressions.append((case, step, quantity, new, ref))
+
+    return regressions
+
+
+def formatValue(quantity, value):
+    if quantity == 'time':
+        return '{0:.4f} s'.format(value)
+    else:
+        return '{0:.1f} MiB'.format(value / 2**20)
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark loading and rendering of synthetic SOFT images.')
+
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Image sizes (pixels along each side) to benchmark.')
+    parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS, help='File formats to benchmark.')
+    parser.add_argument('--variants', nargs='+', default=VARIANTS, choices=VARIANTS, help='Kinds of images to benchmark.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to time each case (the shortest time is kept).')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Do not measure peak memory.')
+    parser.add_argument('--data', default=None, help='Directory in which to keep the generated datasets (default: a temporary directory).')
+    parser.add_argument('-o', '--output', default='results.json', help='Name of file to write results to.')
+    parser.add_argument('--baseline', default=None, help='Results of an earlier run to compare with.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Relative increase over the baseline counted as a regression.')
+    parser.add_argument('--mintime', type=float, default=1e-3, help='Times (in seconds) below which regressions are ignored.')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArguments(argv)
+
+    # Benchmarking broken output is pointless
+    problems = checkExample()
+    if problems:
+        print('Example output check failed:')
+        for problem in problems:
+            print('  '+problem)
+        return 1
+
+    if args.data is None:
+        datadir = tempfile.mkdtemp(prefix='softviz-bench-')
+    else:
+        datadir = args.data
+        os.makedirs(datadir, exist_ok=True)
+
+    outdir = tempfile.mkdtemp(prefix='softviz-plot-')
+
+    results = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'h5py': h5py.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'repeat': args.repeat
+        },
+        'results': {}
+    }
+
+    try:
+        for size, fmt, variant, filename in generateDatasets(datadir, args.sizes, args.formats, args.variants):
+            case = '{0}/{1}/{2}'.format(size, fmt, variant)
+            print('{0}'.format(case), flush=True)
+
+            times = timeCase(filename, variant, outdir, args.repeat)
+            peaks = memoryCase(filename, variant, outdir) if args.memory else {}
+
+            steps = {}
+            for step, t in times.items():
+                steps[step] = {'time': t}
+                if step in peaks:
+                    steps[step]['peakMemory'] = peaks[step]
+
+                print('  {0:42s} {1:>12s} {2:>12s}'.format(step, formatValue('time', t),
+                      formatValue('peakMemory', peaks[step]) if step in peaks else ''), flush=True)
+
+            results['results'][case] = steps
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+        if args.data is None:
+            shutil.rmtree(datadir, ignore_errors=True)
+
+    # Peak resident memory of the whole run (kB on Linux)
+    results['meta']['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to {0}'.format(args.output))
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.tolerance, args.mintime)
+        if regressions:
+            print('\n{0} regression(s) compared to {1}:'.format(len(regressions), args.baseline))
+            for case, step, quantity, new, ref in regressions:
+                print('  {0:20s} {1:42s} {2:>12s} (was {3}, {4:+.0f}%)'.format(case, step,
+                      formatValue(quantity, new), formatValue(quantity, ref), 100*(new/ref - 1)))
+            return 1
+        else:
+            print('No regressions compared to {0}.'.format(args.baseline))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
@@ -0,0 +1,90 @@
+# SOFT COLORMAPS
+#
+# Routines for registering the colormaps used by softviz
+# with matplotlib. Colormaps are only built and registered
+# once per process (unless their settings change).
+#
+
+import matplotlib
+import numpy as np
+from matplotlib.colors import LinearSegmentedColormap
+
+
+# Colors of the perceptually uniform colormap 'GeriMap'
+GERIMAP_COLORS = [(0, 0, 0), (.15, .15, .5), (.3, .15, .75),
+                  (.6, .2, .50), (1, .25, .15), (.9, .5, 0),
+                  (.9, .75, .1), (.9, .9, .5), (1, 1, 1)]
+
+# Transparency threshold of the registered 'GeriMap' (if registered)
+_geriMapRegistered = False
+_geriMapThreshold = None
+
+
+def getColormap(name):
+    """
+    Returns the named (built-in or registered) colormap.
+    """
+    if hasattr(matplotlib, 'colormaps'):
+        return matplotlib.colormaps[name]
+    else:
+        from matplotlib import cm
+        return cm.get_cmap(name)
+
+
+def registerColormap(cmap):
+    """
+    Register the given colormap with matplotlib, replacing any
+    colormap previously registered with the same name.
+    """
+    if hasattr(matplotlib, 'colormaps'):
+        matplotlib.colormaps.register(cmap, force=True)
+    else:
+        # Older versions of matplotlib
+        from matplotlib import cm
+        cm.register_cmap(cmap=cmap)
+
+
+def registerGeriMap(transparencyThreshold=None):
+    """
+    Register the perceptually uniform colormap 'GeriMap' (and its
+    reverse, 'GeriMap_r') with matplotlib. Nothing is done if the
+    colormap has already been registered with the same settings.
+
+    transparencyThreshold: All intensities below this threshold will have
+                           a non-zero alpha value (making them more or
+                           less transparent). The opacity varies linearly,
+                           being 1 at this value, and 0 at zero.
+    """
+    global _geriMapRegistered, _geriMapThreshold
+
+    if _geriMapRegistered and _geriMapThreshold == transparencyThreshold:
+        return
+
+    gm = GERIMAP_COLORS
+    gerimap = LinearSegmentedColormap.from_list('GeriMap', gm)
+    gerimap_r = LinearSegmentedColormap.from_list('GeriMap_r', gm[::-1])
+
+    if transparencyThreshold is not None:
+        n = int(gerimap.N * transparencyThreshold)
+        nn = gerimap.N - n
+
+        if n < 0 or nn < 0:
+            raise ValueError('Transparency threshold must be a value between 0 and 1.')
+
+        a = np.linspace(0, 1, n)
+        b = np.ones((nn,))
+
+        gmap = gerimap(np.arange(gerimap.N))
+        gmap[:,-1] = np.concatenate((a,b), axis=None)
+        gerimap = LinearSegmentedColormap.from_list('GeriMap', gmap)
+
+        gmap_r = gerimap_r(np.arange(gerimap.N))
+        gmap_r[:,-1] = np.concatenate((a,b), axis=None)
+        gerimap_r = LinearSegmentedColormap.from_list('GeriMap_r', gmap_r)
+
+    registerColormap(gerimap)
+    registerColormap(gerimap_r)
+
+    _geriMapRegistered = True
+    _geriMapThreshold = transparencyThreshold
+
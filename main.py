@@ -1,18 +1,39 @@
 #!/usr/bin/env python3
+import os
+import sys
+import time
+
+# Start of the application (for measuring the startup time)
+startTime = time.perf_counter()
+
 from PyQt5 import QtWidgets
+from PyQt5.QtCore import QTimer
 from MainWindow import MainWindow
-import sys
 
 app = None
 
 
+def log_time(event):
+    """
+    Print the time elapsed since the application was
+    started, if the SOFTVIZ_TIMING environment variable
+    is set.
+    """
+    if os.environ.get('SOFTVIZ_TIMING'):
+        sys.stderr.write('{0}: {1:.3f} s\n'.format(event, time.perf_counter()-startTime))
+
+
 def show_main():
     global app
     window = MainWindow()
+    window.imageShown.connect(lambda : log_time('Image shown'))
     window.show()
+    # Fires once the event loop has drawn the window
+    QTimer.singleShot(0, lambda : log_time('Window shown'))
     return app.exec_()
 
 
 if __name__ == '__main__':
+    log_time('Modules imported')
     app = QtWidgets.QApplication(sys.argv)
     sys.exit(show_main())
@@ -5,16 +5,14 @@ import numpy as np
 def limitwall(rc, zc, rlim, zuplim, zlowlim):
     """ Sort out the segments that are within radial
         bound 'rlim' and z interval [zlowlim, zuplim] """
-    nrc, nzc = np.array([]), np.array([])
-    for i in range(len(rc)):
-        if rlim <= 0 or rc[i] < rlim:
-            if zuplim != 0 and zc[i] > zuplim: continue
-            if zlowlim != 0 and zc[i] < zlowlim: continue
+    rc, zc = np.asarray(rc, dtype=float), np.asarray(zc, dtype=float)
 
-            nrc = np.append(nrc, rc[i])
-            nzc = np.append(nzc, zc[i])
+    keep = np.ones(rc.shape, dtype=bool)
+    if rlim > 0: keep &= rc < rlim
+    if zuplim != 0: keep &= ~(zc > zuplim)
+    if zlowlim != 0: keep &= ~(zc < zlowlim)
 
-    return nrc, nzc
+    return rc[keep], zc[keep]
 
 def rotateWall(rc, zc, angle=0, cossin=[]):
     """ Rotate wall section around the symmetry axis """
@@ -0,0 +1,492 @@
+# SOFT OUTPUT FILE ROUTINES
+#
+# Helper routines for efficiently reading (parts of)
+# SOFT output files.
+#
+
+import glob
+import hashlib
+import numpy as np
+import os
+
+
+# Names of the detector geometry variables stored in SOFT output
+GEOMETRY = ['detectorPosition', 'detectorDirection', 'detectorVisang', 'detectorRoll']
+# Directory in which binary copies of legacy text images are cached
+CACHE_DIRECTORY = os.environ.get('SOFTVIZ_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'softviz'))
+# Data types of the Matlab classes which may appear in a SOFT output
+MATLAB_DTYPES = {
+    'double': 'float64', 'single': 'float32',
+    'int8': 'int8', 'int16': 'int16', 'int32': 'int32', 'int64': 'int64',
+    'uint8': 'uint8', 'uint16': 'uint16', 'uint32': 'uint32', 'uint64': 'uint64',
+    'logical': 'bool', 'char': 'str'
+}
+
+
+def h5view(dataset, slices=None):
+    """
+    Returns a read-only view of the given h5py dataset, with its
+    axes reversed to match the orientation used when plotting.
+
+    If the dataset is stored contiguously and uncompressed, the
+    data is memory-mapped directly from the file and pages are only
+    read from disk as they are accessed. Otherwise, the dataset is
+    read in full (but still not copied when transposed).
+
+    dataset: h5py dataset to view.
+    slices:  Optional tuple (rows, cols) of slices (as returned by
+             'imageSlices') selecting the part of the (transposed)
+             image to view. Only the selected part is read.
+    """
+    if not isMemoryMappable(dataset):
+        return h5read(dataset, slices)
+
+    arr = np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r',
+                    offset=dataset.id.get_offset(), shape=dataset.shape)
+
+    if slices is not None:
+        arr = arr[slices[1], slices[0]]
+
+    return arr.T
+
+
+def h5read(dataset, slices=None):
+    """
+    Read the given 2D h5py dataset into memory, with its axes
+    reversed to match the orientation used when plotting.
+
+    dataset: h5py dataset to read.
+    slices:  Optional tuple (rows, cols) of slices (as returned by
+             'imageSlices') selecting the part of the (transposed)
+             image to read. The selection is passed on to HDF5 as a
+             hyperslab, so that only the chunks needed are read.
+    """
+    if slices is None:
+        return np.transpose(dataset[:,:])
+    else:
+        return np.transpose(dataset[slices[1], slices[0]])
+
+
+def h5stack(datasets, slices=None, dtype=None, lazy=False, progress=None):
+    """
+    Read several 2D h5py datasets of the same shape into one block
+    of memory. Returns an array of shape (n, rows, cols), oriented
+    as the images are plotted (or a list of n arrays, see 'lazy').
+
+    The data is read directly into the block, in the order it is
+    stored in the file, so each image is a (transposed) view and
+    nothing is copied after reading.
+
+    datasets: List of the n datasets to read.
+    slices:   Optional tuple (rows, cols) of slices (as returned by
+              'imageSlices') selecting the part of each image to read.
+    dtype:    Data type to read the data as (converted by HDF5 while
+              reading). Defaults to the data type of the first dataset.
+    lazy:     If True, and the datasets are stored uncompressed, with
+              the same data type and evenly spaced in the file, they
+              are memory-mapped as one array instead of being read.
+              If they are not evenly spaced, a list with a memory-map
+              of each dataset is returned instead.
+    progress: Optional function 'progress(fraction)', called after
+              each dataset has been read.
+    """
+    if lazy and _isMappable(datasets) and (dtype is None or np.dtype(dtype) == datasets[0].dtype):
+        if not _isEvenlySpaced(datasets):
+            return [h5view(ds, slices) for ds in datasets]
+
+        arr = _mapStack(datasets)
+        if slices is not None:
+            arr = arr[:, slices[1], slices[0]]
+
+        return arr.transpose((0, 2, 1))
+
+    if dtype is None:
+        dtype = datasets[0].dtype
+
+    shape = datasets[0].shape
+    if slices is not None:
+        shape = (len(range(*slices[1].indices(shape[0]))), len(range(*slices[0].indices(shape[1]))))
+
+    arr = np.empty((len(datasets),)+shape, dtype=dtype)
+    for i, ds in enumerate(datasets):
+        if ds.shape != datasets[0].shape:
+            raise ValueError("Dataset '{0}' has shape {1}, but expected {2}.".format(ds.name, ds.shape, datasets[0].shape))
+
+        if slices is None:
+            ds.read_direct(arr[i])
+        else:
+            ds.read_direct(arr[i], source_sel=np.s_[slices[1], slices[0]])
+
+        if progress is not None:
+            progress((i+1) / len(datasets))
+
+    return arr.transpose((0, 2, 1))
+
+
+def _isMappable(datasets):
+    """
+    Checks whether the given datasets can all be memory-mapped,
+    and have the same shape and data type.
+    """
+    if not all([isMemoryMappable(ds) for ds in datasets]):
+        return False
+
+    first = datasets[0]
+    return all([ds.shape == first.shape and ds.dtype == first.dtype for ds in datasets])
+
+
+def _isEvenlySpaced(datasets):
+    """
+    Checks whether the given (memory-mappable, see '_isMappable')
+    datasets are evenly spaced in the file, so that they can be
+    mapped as one array.
+    """
+    first = datasets[0]
+    offsets = [ds.id.get_offset() for ds in datasets]
+    spacing = np.diff(offsets)
+    nbytes = first.size * first.dtype.itemsize
+
+    return len(datasets) == 1 or (np.all(spacing == spacing[0]) and spacing[0] >= nbytes and spacing[0] % first.dtype.itemsize == 0)
+
+
+def _mapStack(datasets):
+    """
+    Memory-map the evenly spaced datasets as one array of
+    shape (n, ...) (with gaps between the datasets skipped).
+    """
+    first = datasets[0]
+    offset = first.id.get_offset()
+    spacing = datasets[1].id.get_offset() - offset if len(datasets) > 1 else first.size * first.dtype.itemsize
+    length = spacing * (len(datasets)-1) // first.dtype.itemsize + first.size
+
+    mm = np.memmap(first.file.filename, dtype=first.dtype, mode='r', offset=offset, shape=(length,))
+    strides = (spacing,) + tuple(np.empty(first.shape, dtype=first.dtype).strides)
+
+    return np.lib.stride_tricks.as_strided(mm, shape=(len(datasets),)+first.shape, strides=strides, writeable=False)
+
+
+def imageSlices(shape, region=None, stride=None):
+    """
+    Convert a region of interest and stride into a tuple of
+    slices (rows, cols) into an image of the given shape (as it is
+    plotted). Returns None if the whole image is selected.
+
+    shape:  Shape (rows, cols) of the full image.
+    region: Tuple ((row0, row1), (col0, col1)) with the (half-open)
+            ranges of rows and columns to select. Either range may
+            be None to select all rows/columns.
+    stride: Take every n'th pixel. Either an integer, or a tuple
+            (rowstride, colstride).
+    """
+    if region is None and stride is None:
+        return None
+
+    if region is None: region = (None, None)
+    if stride is None: stride = 1
+    if np.isscalar(stride): stride = (stride, stride)
+
+    slices = []
+    for n, rng, step in zip(shape, region, stride):
+        if int(step) < 1:
+            raise ValueError("Invalid stride: {0}. The stride must be a positive integer.".format(step))
+
+        if rng is None:
+            rng = (0, n)
+
+        start, stop, step = slice(rng[0], rng[1], int(step)).indices(n)
+        if stop <= start:
+            raise ValueError("Empty region of interest: {0}.".format(region))
+
+        slices.append(slice(start, stop, step))
+
+    return tuple(slices)
+
+
+def sliceExtent(extent, shape, slices, origin='upper'):
+    """
+    Returns the extent covered by the part of an image selected
+    by 'slices', so that each selected pixel is drawn centred on
+    the pixel it was taken from in the full image.
+
+    extent: Extent [left, right, bottom, top] of the full image.
+    shape:  Shape (rows, cols) of the full image.
+    slices: Tuple (rows, cols) of slices, as returned by 'imageSlices'.
+    origin: Placement of row 0 of the image ('upper' or 'lower'),
+            as in 'matplotlib.pyplot.imshow'.
+    """
+    if slices is None:
+        return extent
+
+    bounds = []
+    for s, n in zip(slices, shape):
+        start, stop, step = s.indices(n)
+        count = len(range(start, stop, step))
+        lower = start + 0.5 - step/2
+        bounds.append((lower / n, (lower + count*step) / n))
+
+    (y0, y1), (x0, x1) = bounds
+    w, h = extent[1]-extent[0], extent[3]-extent[2]
+
+    if origin == 'upper':
+        return [extent[0] + w*x0, extent[0] + w*x1, extent[3] - h*y1, extent[3] - h*y0]
+    else:
+        return [extent[0] + w*x0, extent[0] + w*x1, extent[2] + h*y0, extent[2] + h*y1]
+
+
+def isMemoryMappable(dataset):
+    """
+    Checks whether the given h5py dataset can be memory-mapped
+    directly from its file, i.e. whether it is a contiguous,
+    uncompressed and already allocated numeric array.
+    """
+    return (dataset.chunks is None and dataset.compression is None and
+            dataset.dtype.kind in 'fiu' and dataset.id.get_offset() is not None)
+
+
+def loadText(filename, cache=False):
+    """
+    Load a legacy text image (.dat/.topview file).
+
+    filename: Name of file to load.
+    cache:    If True, a binary copy of the image is stored in
+              'CACHE_DIRECTORY' the first time the file is loaded,
+              and memory-mapped on subsequent loads. The cache is
+              keyed on the path, size and modification time of the
+              file, so that stale copies are never used.
+    """
+    if not cache:
+        return readText(filename)
+
+    cachefile = _textCacheName(filename)
+    if os.path.isfile(cachefile):
+        try:
+            return np.load(cachefile, mmap_mode='r')
+        except (OSError, ValueError):
+            pass
+
+    data = readText(filename)
+
+    try:
+        _writeTextCache(cachefile, data)
+    except OSError:
+        pass
+
+    return data
+
+
+def readText(filename):
+    """
+    Parse a whitespace-separated text image. The whole file
+    is parsed in one go, which is much faster than using
+    'np.genfromtxt'.
+    """
+    with open(filename, 'r') as f:
+        text = f.read()
+
+    # Remove comments (as 'np.genfromtxt' does)
+    if '#' in text:
+        text = '\n'.join([line.split('#', 1)[0] for line in text.splitlines()])
+
+    ncols = 0
+    for line in text.splitlines():
+        ncols = len(line.split())
+        if ncols > 0:
+            break
+
+    try:
+        data = np.fromstring(text, sep=' ')
+    except ValueError:
+        data = None
+
+    if ncols == 0 or data is None or data.size % ncols != 0:
+        # Irregular file: let numpy figure it out
+        return np.genfromtxt(filename)
+
+    data = data.reshape((-1, ncols))
+    if data.shape[0] == 1:
+        data = data[0]
+
+    return data
+
+
+def _textCacheName(filename):
+    """
+    Returns the name of the cache file for the given text image.
+    """
+    st = os.stat(filename)
+    return os.path.join(CACHE_DIRECTORY, '{0}-{1}-{2}.npy'.format(_pathKey(filename), st.st_size, st.st_mtime_ns))
+
+
+def _writeTextCache(cachefile, data):
+    """
+    Store the given data in the named cache file, removing any
+    stale copies of the same text image.
+    """
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+
+    key = os.path.basename(cachefile).split('-')[0]
+    for f in glob.glob(os.path.join(CACHE_DIRECTORY, key+'-*.npy')):
+        os.remove(f)
+
+    # Write to a temporary file first, so that an interrupted
+    # write never leaves a corrupt cache file behind
+    tmpfile = cachefile + '.tmp'
+    with open(tmpfile, 'wb') as f:
+        np.save(f, data)
+    os.replace(tmpfile, cachefile)
+
+
+def _pathKey(filename):
+    """
+    Returns a hash identifying the absolute path of the given file.
+    """
+    return hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+
+
+def fileSignature(filename):
+    """
+    Returns a tuple (size, mtime) which changes whenever the named
+    file is modified, or None if the file does not exist.
+    """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+
+    return (st.st_size, st.st_mtime_ns)
+
+
+def isConsistent(filename):
+    """
+    Checks whether the named SOFT output file is consistent, i.e.
+    that its metadata can be read and that it contains an image.
+    Files which are in the middle of being written usually fail
+    this check.
+    """
+    try:
+        return probe(filename)['imageShape'] is not None
+    except Exception:
+        return False
+
+
+def probe(filename):
+    """
+    Read only the metadata of a SOFT output file, without
+    reading any pixel data. Returns a dict with the keys
+
+      format:      'mat' (legacy Matlab), 'hdf5' or 'dat'.
+      arrays:      Dict mapping the name of each variable in the
+                   file to a tuple (shape, dtype), with the shape
+                   as it is stored in the file.
+      imageShape:  Shape of the image as it will be plotted.
+      polarized:   True if the file contains Stokes parameters.
+      hasWall:     True if the file contains a wall overlay.
+      hasSeparatrix: True if the file contains a separatrix overlay.
+
+    as well as 'detectorPosition', 'detectorDirection', 'detectorVisang'
+    and 'detectorRoll' (None if not stored in the file).
+
+    filename: Name of file to probe.
+    """
+    if filename.endswith('.dat') or filename.endswith('.topview'):
+        info = _probeDAT(filename)
+    elif filename.endswith('.mat'):
+        import h5py
+        if h5py.is_hdf5(filename):
+            info = _probeHDF5(filename)
+        else:
+            info = _probeMAT(filename)
+    elif filename.endswith('.h5') or filename.endswith('.hdf5'):
+        info = _probeHDF5(filename)
+    else:
+        raise NotImplementedError("Unrecognized image format. Unable to probe file.")
+
+    arrays = info['arrays']
+    info['polarized'] = 'StokesI' in arrays
+    info['hasWall'] = 'wall' in arrays
+    info['hasSeparatrix'] = 'separatrix' in arrays
+
+    info['imageShape'] = None
+    for name in ['image', 'StokesI']:
+        if name in arrays:
+            # Text images are plotted as stored, all others transposed
+            if info['format'] == 'dat':
+                info['imageShape'] = tuple(arrays[name][0])
+            else:
+                info['imageShape'] = tuple(reversed(arrays[name][0]))
+            break
+
+    for name in GEOMETRY:
+        info.setdefault(name, None)
+
+    return info
+
+
+def _probeDAT(filename):
+    """
+    Probe a legacy text image, by counting its rows and columns.
+    """
+    ncols, nrows = 0, 0
+    with open(filename, 'r') as f:
+        for line in f:
+            n = len(line.split())
+            if n > 0:
+                ncols = n
+                nrows = 1
+                break
+
+        for line in f:
+            if line.strip():
+                nrows += 1
+
+    return {'format': 'dat', 'arrays': {'image': ((nrows, ncols), np.dtype('float64'))}}
+
+
+def _probeHDF5(filename):
+    """
+    Probe a HDF5 file (used also for modern Matlab files).
+    """
+    import h5py
+
+    info = {'format': 'hdf5', 'arrays': {}}
+    with h5py.File(filename, 'r') as f:
+        for name, ds in f.items():
+            if isinstance(ds, h5py.Dataset):
+                info['arrays'][name] = (ds.shape, ds.dtype)
+
+        for name in GEOMETRY:
+            if name in f:
+                info[name] = _geometryValue(name, f[name][()])
+
+    return info
+
+
+def _probeMAT(filename):
+    """
+    Probe a legacy Matlab file.
+    """
+    import scipy.io
+
+    info = {'format': 'mat', 'arrays': {}}
+    for name, shape, cls in scipy.io.whosmat(filename):
+        info['arrays'][name] = (shape, np.dtype(MATLAB_DTYPES.get(cls, 'object')))
+
+    names = [name for name in GEOMETRY if name in info['arrays']]
+    matfile = scipy.io.loadmat(filename, variable_names=names)
+    for name in names:
+        info[name] = _geometryValue(name, matfile[name])
+
+    return info
+
+
+def _geometryValue(name, value):
+    """
+    Convert a detector geometry variable to the form used
+    by 'SyntheticImage' (3-vectors or scalars).
+    """
+    value = np.ravel(value)
+    if name in ['detectorPosition', 'detectorDirection']:
+        return value[:3]
+    else:
+        return value[0]
+
@@ -0,0 +1,125 @@
+# SOFT THUMBNAILS
+#
+# Small previews of SOFT outputs, shown in the file browser.
+# Thumbnails are rendered from a downsampled read of the image
+# (only every n'th pixel is read from HDF5 files), using the
+# same colormap and intensity scale as the main plot, and are
+# stored as PNG files in an on-disk cache. The cache is keyed
+# on the path, size and modification time of the SOFT output,
+# and on the render settings, so stale thumbnails are never used.
+#
+# Rendering does not require Qt, so that it can be run in
+# separate worker processes.
+#
+
+import glob
+import hashlib
+import numpy as np
+import os
+
+from PolarizedImage import ImageType
+from softio import CACHE_DIRECTORY, probe
+
+
+# Directory in which thumbnails are cached
+THUMBNAIL_DIRECTORY = os.path.join(CACHE_DIRECTORY, 'thumbnails')
+# Default size (pixels) of the longest side of a thumbnail
+THUMBNAIL_SIZE = 128
+# Extensions of the SOFT outputs listed in the browser
+EXTENSIONS = ['.dat', '.h5', '.hdf5', '.mat']
+# Version of the rendering, included in the cache key. Increment
+# whenever rendering changes, so that cached thumbnails are redone.
+RENDER_VERSION = 2
+
+
+def listOutputs(directory):
+    """
+    Returns a sorted list of all SOFT outputs in the given directory.
+    """
+    files = []
+    for f in os.listdir(directory):
+        path = os.path.join(directory, f)
+        if os.path.splitext(f)[1].lower() in EXTENSIONS and os.path.isfile(path):
+            files.append(path)
+
+    return sorted(files)
+
+
+def getThumbnail(filename, size=THUMBNAIL_SIZE, colormapName='GeriMap', logarithmic=False, imgtype=ImageType.I):
+    """
+    Returns the name of a PNG file containing a thumbnail of the
+    given SOFT output. The thumbnail is rendered (and cached) if
+    it is not already in the cache.
+
+    filename:     Name of SOFT output.
+    size:         Size of the longest side of the thumbnail.
+    colormapName: Name of colormap to use.
+    logarithmic:  If True, use a logarithmic intensity scale.
+    imgtype:      Polarization quantity to show (polarized images only).
+    """
+    thumbfile = thumbnailName(filename, size, colormapName, logarithmic, imgtype)
+    if os.path.isfile(thumbfile):
+        return thumbfile
+
+    from PIL import Image
+    image = Image.fromarray(renderThumbnail(filename, size, colormapName, logarithmic, imgtype))
+
+    # Remove thumbnails of earlier versions of the file
+    os.makedirs(THUMBNAIL_DIRECTORY, exist_ok=True)
+    key = os.path.basename(thumbfile).split('-')[0]
+    for f in glob.glob(os.path.join(THUMBNAIL_DIRECTORY, key+'-*.png')):
+        os.remove(f)
+
+    # Write to a temporary file first, so that other processes
+    # never see a partially written thumbnail
+    tmpfile = thumbfile + '.tmp'
+    image.save(tmpfile, format='PNG')
+    os.replace(tmpfile, thumbfile)
+
+    return thumbfile
+
+
+def renderThumbnail(filename, size=THUMBNAIL_SIZE, colormapName='GeriMap', logarithmic=False, imgtype=ImageType.I):
+    """
+    Render a thumbnail of the given SOFT output. Returns an RGBA
+    array (uint8) whose longest side is (at most) 'size' pixels.
+    (See 'getThumbnail' for a description of the parameters)
+    """
+    from matplotlib.figure import Figure
+    from PIL import Image
+    from SyntheticImage import SyntheticImage
+
+    # Only read every n'th pixel of large images. Text files must
+    # be read in full anyway, so their size is not probed.
+    stride = None
+    if not filename.endswith('.dat'):
+        shape = probe(filename)['imageShape']
+        if shape is not None:
+            stride = max(1, max(shape) // size)
+
+    si = SyntheticImage(Figure(), None)
+    si.setImageFileData(SyntheticImage.readImageFile(filename, imgtype, lazy=True, cache=True, stride=stride))
+    try:
+        si.setColormap(colormapName)
+        si.toggleLogarithmic(logarithmic)
+        rgba = si.getRaster(8)
+    finally:
+        si.closeFile()
+
+    image = Image.fromarray(rgba)
+    image.thumbnail((size, size))
+
+    return np.asarray(image)
+
+
+def thumbnailName(filename, size, colormapName, logarithmic, imgtype):
+    """
+    Returns the name of the cache file for the thumbnail of
+    the given SOFT output, rendered with the given settings.
+    """
+    st = os.stat(filename)
+    settings = '{0}|{1}|{2}|{3}|{4}|{5}'.format(os.path.abspath(filename), size, colormapName, logarithmic, imgtype.value, RENDER_VERSION)
+    key = hashlib.sha1(settings.encode('utf-8')).hexdigest()
+
+    return os.path.join(THUMBNAIL_DIRECTORY, '{0}-{1}-{2}.png'.format(key, st.st_size, st.st_mtime_ns))
+
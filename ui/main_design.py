@@ -132,6 +132,9 @@ class Ui_MainWindow(object):
         self.cbSeparatrix.setEnabled(False)
         self.cbSeparatrix.setGeometry(QtCore.QRect(20, 280, 241, 26))
         self.cbSeparatrix.setObjectName("cbSeparatrix")
+        self.cbWatch = QtWidgets.QCheckBox(self.centralwidget)
+        self.cbWatch.setGeometry(QtCore.QRect(300, 280, 241, 26))
+        self.cbWatch.setObjectName("cbWatch")
         self.cbImageType = QtWidgets.QComboBox(self.centralwidget)
         self.cbImageType.setEnabled(True)
         self.cbImageType.setGeometry(QtCore.QRect(100, 130, 441, 27))
@@ -179,5 +182,7 @@ class Ui_MainWindow(object):
         self.btnWall.setText(_translate("MainWindow", "3D Wall Overlay"))
         self.cbWallCross.setText(_translate("MainWindow", "Wall cross-section"))
         self.cbSeparatrix.setText(_translate("MainWindow", "Separatrix"))
+        self.cbWatch.setToolTip(_translate("MainWindow", "Reload the file automatically when it changes"))
+        self.cbWatch.setText(_translate("MainWindow", "Watch file"))
         self.label_4.setText(_translate("MainWindow", "Type:"))
 